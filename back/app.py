@@ -1,10 +1,13 @@
 import logging
+from datetime import datetime, timezone
 from typing import Any
 
 from flask import Flask, Response, request, send_file, send_from_directory
 
 from mybelts.api import blueprint as api_blueprint
-from mybelts.schema import HTTPRequest, session_context
+from mybelts.audit import audit_writer
+from mybelts.config import AUDIT_HTTP_REQUESTS
+from mybelts.metrics import init_metrics
 
 
 def create_app() -> Flask:
@@ -35,25 +38,27 @@ def create_app() -> Flask:
         logging.basicConfig()
         logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
 
+    if app.debug or AUDIT_HTTP_REQUESTS:
         @app.after_request
         def save_http_request(response: Response) -> Response:
-            with session_context() as session:
-                http_request_response = HTTPRequest(
-                    request_remote_addr=request.remote_addr,
-                    request_method=request.method,
-                    request_url=request.url,
-                    request_path=request.path,
-                    request_headers=dict(request.headers),
-                    request_body=request.data,
-                    response_status_code=response.status_code,
-                    response_status=response.status,
-                    response_headers=dict(response.headers),
-                    # response_body=response.data,
-                )
-                session.add(http_request_response)
-                session.commit()
+            # written in the background
+            audit_writer.record({
+                'created': datetime.now(timezone.utc),
+                'request_remote_addr': request.remote_addr,
+                'request_method': request.method,
+                'request_url': request.url,
+                'request_path': request.path,
+                'request_headers': dict(request.headers),
+                'request_body': request.data,
+                'response_status_code': response.status_code,
+                'response_status': response.status,
+                'response_headers': dict(response.headers),
+                # 'response_body': response.data,
+            })
             return response
 
+    init_metrics(app)
+
     return app
 
 
@@ -0,0 +1,33 @@
+# read by gunicorn from the current directory
+from multiprocessing import cpu_count
+from os import environ
+from typing import Any
+
+bind = environ.get('GUNICORN_BIND', '0.0.0.0:20684')
+workers = int(environ.get('WEB_CONCURRENCY', cpu_count()))
+# read by mybelts.config, to share DB_MAX_CONNECTIONS between the workers
+environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = 'gevent'
+# import the application once, before forking the workers
+preload_app = True
+
+
+def on_starting(server: Any) -> None:
+    # with the number of workers given on the command line, if any
+    from mybelts.config import DB_MAX_CONNECTIONS, DB_POOL_MAX_OVERFLOW, DB_POOL_SIZE, DB_POOLS
+
+    max_connections = server.cfg.workers * DB_POOLS * (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW)
+    if max_connections > DB_MAX_CONNECTIONS:
+        message = (
+            f'{server.cfg.workers} workers can open up to {max_connections} connections to the database, '
+            f'over DB_MAX_CONNECTIONS ({DB_MAX_CONNECTIONS}); lower WEB_CONCURRENCY, DB_POOL_SIZE or '
+            f'DB_POOL_MAX_OVERFLOW'
+        )
+        raise RuntimeError(message)
+
+
+def post_worker_init(_worker: Any) -> None:
+    # after gevent patched the standard library of the worker
+    from mybelts.workers import init_worker
+
+    init_worker()
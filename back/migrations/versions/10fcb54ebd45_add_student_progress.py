@@ -0,0 +1,39 @@
+import sqlalchemy as sa
+from alembic import op
+
+revision = '10fcb54ebd45'
+down_revision = '68822a901af4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'student_progress',
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('skill_domain_id', sa.Integer(), nullable=False),
+        sa.Column('belt_id', sa.Integer(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['belt_id'], ['belt.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['skill_domain_id'], ['skill_domain.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['student_id'], ['student.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('student_id', 'skill_domain_id'),
+    )
+    op.create_index(op.f('ix_student_progress_belt_id'), 'student_progress', ['belt_id'], unique=False)
+    # from the existing evaluations
+    op.execute("""
+        INSERT INTO student_progress (student_id, skill_domain_id, belt_id, attempts)
+        SELECT
+            evaluation.student_id,
+            evaluation.skill_domain_id,
+            (array_agg(evaluation.belt_id ORDER BY belt.rank DESC) FILTER (WHERE evaluation.success))[1],
+            count(*)
+        FROM evaluation
+        JOIN belt ON belt.id = evaluation.belt_id
+        GROUP BY evaluation.student_id, evaluation.skill_domain_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_student_progress_belt_id'), table_name='student_progress')
+    op.drop_table('student_progress')
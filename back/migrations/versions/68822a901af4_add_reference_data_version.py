@@ -0,0 +1,21 @@
+import sqlalchemy as sa
+from alembic import op
+
+revision = '68822a901af4'
+down_revision = 'c667cc6bd4de'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'reference_data_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute('INSERT INTO reference_data_version (id) VALUES (1)')
+
+
+def downgrade() -> None:
+    op.drop_table('reference_data_version')
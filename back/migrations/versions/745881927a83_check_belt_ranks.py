@@ -0,0 +1,37 @@
+from alembic import op
+
+revision = '745881927a83'
+down_revision = 'bcf84cdb0c96'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Ranks are unique, positive, and the highest one is the number of belts,
+    # so they go from 1 to N; checked at commit
+    op.create_unique_constraint('belt_rank_key', 'belt', ['rank'], deferrable=True, initially='DEFERRED')
+    op.create_check_constraint('belt_rank_positive', 'belt', 'rank >= 1')
+    op.execute("""
+        CREATE OR REPLACE FUNCTION check_belt_ranks() RETURNS trigger AS $$
+        BEGIN
+            IF (SELECT coalesce(max(rank), 0) <> count(*) FROM belt) THEN
+                RAISE EXCEPTION 'Belt ranks do not go from 1 to the number of belts'
+                    USING ERRCODE = 'integrity_constraint_violation';
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE CONSTRAINT TRIGGER belt_ranks_dense
+        AFTER INSERT OR UPDATE OF rank OR DELETE ON belt
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE FUNCTION check_belt_ranks()
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER belt_ranks_dense ON belt')
+    op.execute('DROP FUNCTION check_belt_ranks()')
+    op.drop_constraint('belt_rank_positive', 'belt', type_='check')
+    op.drop_constraint('belt_rank_key', 'belt', type_='unique')
@@ -0,0 +1,41 @@
+from io import BytesIO
+from typing import Any
+
+import sqlalchemy as sa
+from alembic import op
+
+from mybelts.blobstore import blob_store
+
+revision = '87a0e6d44ef5'
+down_revision = '74c0ed975459'
+branch_labels = None
+depends_on = None
+
+
+def execute(statement: str, **params: Any) -> Any:
+    return op.get_bind().execute(sa.text(statement), params)  # type: ignore
+
+
+def upgrade() -> None:
+    # Move 'exam.file' to the blob store, as 'exam.file_hash'
+    op.add_column('exam', sa.Column('file_hash', sa.String(), nullable=True))
+    exam_ids = execute('SELECT id FROM exam').scalars().all()
+    for exam_id in exam_ids:
+        # one file at a time
+        file = execute('SELECT file FROM exam WHERE id = :id', id=exam_id).scalar_one()
+        file_hash = blob_store.put(BytesIO(file))
+        execute('UPDATE exam SET file_hash = :file_hash WHERE id = :id', id=exam_id, file_hash=file_hash)
+    op.alter_column('exam', 'file_hash', nullable=False)
+    op.create_index(op.f('ix_exam_file_hash'), 'exam', ['file_hash'], unique=False)
+    op.drop_column('exam', 'file')
+
+
+def downgrade() -> None:
+    # Move 'exam.file_hash' back to 'exam.file'; the blob store is left as is
+    op.add_column('exam', sa.Column('file', sa.LargeBinary(), nullable=True))
+    rows = execute('SELECT id, file_hash FROM exam').all()
+    for exam_id, file_hash in rows:
+        execute('UPDATE exam SET file = :file WHERE id = :id', id=exam_id, file=blob_store.get(file_hash))
+    op.alter_column('exam', 'file', nullable=False)
+    op.drop_index(op.f('ix_exam_file_hash'), table_name='exam')
+    op.drop_column('exam', 'file_hash')
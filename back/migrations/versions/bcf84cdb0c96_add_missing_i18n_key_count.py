@@ -0,0 +1,33 @@
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'bcf84cdb0c96'
+down_revision = '10fcb54ebd45'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'missing_i18n_key_count',
+        sa.Column('language', sa.String(), nullable=False),
+        sa.Column('namespace', sa.String(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('first_seen', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_seen', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('language', 'namespace', 'key'),
+    )
+    op.create_index(op.f('ix_missing_i18n_key_count_last_seen'), 'missing_i18n_key_count', ['last_seen'], unique=False)
+    # from the existing events
+    op.execute("""
+        INSERT INTO missing_i18n_key_count (language, namespace, key, count, first_seen, last_seen)
+        SELECT language, namespace, key, count(*), min(created), max(created)
+        FROM missing_i18n_key
+        GROUP BY language, namespace, key
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_missing_i18n_key_count_last_seen'), table_name='missing_i18n_key_count')
+    op.drop_table('missing_i18n_key_count')
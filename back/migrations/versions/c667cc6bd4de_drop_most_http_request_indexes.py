@@ -0,0 +1,28 @@
+from alembic import op
+
+revision = 'c667cc6bd4de'
+down_revision = '87a0e6d44ef5'
+branch_labels = None
+depends_on = None
+
+columns = [
+    'request_headers',
+    'request_method',
+    'request_path',
+    'request_remote_addr',
+    'request_url',
+    'response_headers',
+    'response_status',
+    'response_status_code',
+]
+
+
+def upgrade() -> None:
+    # Only keep the index on 'http_request.created'
+    for column in columns:
+        op.drop_index(op.f(f'ix_http_request_{column}'), table_name='http_request')
+
+
+def downgrade() -> None:
+    for column in columns:
+        op.create_index(op.f(f'ix_http_request_{column}'), 'http_request', [column], unique=False)
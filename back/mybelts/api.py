@@ -1,23 +1,50 @@
 from __future__ import annotations
 
+from csv import DictReader
+from csv import Error as CSVError
 from datetime import date, datetime, timedelta, timezone
-from io import BytesIO
+from http import HTTPStatus
+from io import TextIOWrapper
+from os import fstat, remove
+from re import fullmatch
 from tempfile import NamedTemporaryFile
 from typing import TYPE_CHECKING, Any, NoReturn
 
 import jwt
-from flask import Blueprint, request, send_file, url_for
+from flask import Blueprint, Response, request, send_file, url_for
 from flask_restx import Api, Resource, fields  # type: ignore
 from flask_restx.apidoc import apidoc  # type: ignore
 from flask_restx.reqparse import FileStorage  # type: ignore
 from jsonschema import FormatChecker
+from psycopg2 import errorcodes  # type: ignore
 from psycopg2.errors import UniqueViolation  # type: ignore
-from sqlalchemy import and_
+from sqlalchemy import and_, case, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.sql.expression import func
 
-from mybelts.config import SECRET
-from mybelts.exams2pdf import exams_to_print, print_exams_as_pdf
+from mybelts.audit import audit_writer
+from mybelts.blobstore import blob_store
+from mybelts.config import MISSING_I18N_KEY_BATCH_SIZE, REPLICA_STICKINESS, SECRET
+from mybelts.database import pool_stats
+from mybelts.exams2pdf import (
+    exams_to_print,
+    forget_stamped_exams_of_exam,
+    forget_stamped_exams_of_student,
+    print_exams_as_pdf,
+    stamp_store,
+    warm_stamp_of_student,
+    warm_stamps_of_students,
+)
+from mybelts.i18nkeys import record_missing_i18n_keys
+from mybelts.jobs import Job, QueueFullError, get_job, job_result_path, submit_print_job
+from mybelts.metrics import metrics_json
+from mybelts.passwords import QueueFullError as PasswordQueueFullError
+from mybelts.passwords import hash_password, hash_passwords, verify_password
+from mybelts.principals import Principal, cache_principal, forget_principals, get_cached_principal
+from mybelts.progress import progress_of_belts, refresh_student_progress
+from mybelts.referencedata import bump_reference_data_version, get_reference_data
 from mybelts.schema import (
     Belt,
     Class,
@@ -25,16 +52,25 @@ from mybelts.schema import (
     Exam,
     Level,
     MissingI18nKey,
+    MissingI18nKeyCount,
     SkillDomain,
     Student,
+    StudentProgress,
     User,
     WaitlistEntry,
+    engine,
+    has_replica,
+    read_engine,
+    replica_stats,
     session_context,
 )
 
 # add typing to flask_restx.abort()
 if TYPE_CHECKING:
-    from sqlalchemy.orm import Session
+    from contextlib import AbstractContextManager
+
+    from sqlalchemy.orm import Session, scoped_session
+    from sqlalchemy_utils.types.password import Password  # type: ignore
     def abort(_code: int, _message: str) -> NoReturn:
         ...
 else:
@@ -237,6 +273,14 @@ api_model_student_list_bare = api.model('StudentListBare', {
     'students': fields.List(fields.Nested(api_model_student), required=True),
 })
 
+api_model_student_import = api.model('StudentImport', {
+    'students': fields.List(fields.Nested(api_model_student), required=True),
+    'conflicts': fields.List(fields.Nested(api.model('StudentImportConflict', {
+        'row': fields.Integer(example=3, required=True, description='Position in the roster, from 1'),
+        'username': fields.String(example='jdoe', required=True),
+    })), required=True),
+})
+
 api_model_student_one = api.model('StudentOne', {
     'level': fields.Nested(api_model_level, required=True),
     'class': fields.Nested(api_model_class, required=True),
@@ -299,30 +343,122 @@ api_model_exam_one = api.model('ExamOne', {
     'exam': fields.Nested(api_model_exam, required=True),
 })
 
+api_model_exam_pdf_timings = api.model('ExamPdfTimings', {
+    'cache': fields.Float(example=0.012, help='Seconds spent looking up the exams already stamped'),
+    'stamp': fields.Float(example=0.123, help='Seconds spent rendering the name-stamps'),
+    'concatenation': fields.Float(example=0.045, help='Seconds spent gathering the exams'),
+    'multistamp': fields.Float(example=0.067, help='Seconds spent stamping the exams'),
+    'nup': fields.Float(example=0.089, help='Seconds spent grouping the pages by two'),
+})
+
+api_model_exam_pdf_job = api.model('ExamPdfJob', {
+    'id': fields.String(example='5d41402abc4b2a76b9719d911017c592', required=True),
+    'status': fields.String(example='pending', enum=['pending', 'done', 'failed'], required=True),
+    'error': fields.String(example='No such file or directory: inkscape'),
+    'timings': fields.Nested(api_model_exam_pdf_timings),
+})
+
+api_model_exam_pdf_job_one = api.model('ExamPdfJobOne', {
+    'job': fields.Nested(api_model_exam_pdf_job, required=True),
+})
+
+api_model_histogram = api.model('Histogram', {
+    'bounds': fields.List(fields.Float, required=True, help='Upper bounds of the buckets but the last one'),
+    'counts': fields.List(fields.Integer, required=True, help='Number of values in each bucket'),
+    'count': fields.Integer(example=42, required=True),
+    'sum': fields.Float(example=4.2, required=True),
+})
+
+api_model_endpoint_metrics = api.model('EndpointMetrics', {
+    'endpoint': fields.String(example='GET /api/classes/<int:class_id>', required=True),
+    'latency': fields.Nested(api_model_histogram, required=True, help='In seconds'),
+    'statements': fields.Nested(api_model_histogram, required=True, help='SQL statements'),
+    'db_time': fields.Nested(api_model_histogram, required=True, help='In seconds'),
+    'rows': fields.Nested(api_model_histogram, required=True, help='Rows fetched'),
+})
+
+api_model_audit_stats = api.model('AuditStats', {
+    'queued': fields.Integer(example=42, required=True),
+    'sampled_out': fields.Integer(example=0, required=True),
+    'dropped': fields.Integer(example=0, required=True, help='Because the queue was full'),
+    'written': fields.Integer(example=40, required=True),
+    'failed': fields.Integer(example=0, required=True),
+    'pending': fields.Integer(example=2, required=True),
+})
+
+api_model_database_pool_stats = api.model('DatabasePoolStats', {
+    'size': fields.Integer(example=5, required=True),
+    'checked_out': fields.Integer(example=2, required=True),
+    'overflow': fields.Integer(example=0, required=True, help='Connections beyond the size of the pool'),
+    'max_overflow': fields.Integer(example=3, required=True),
+    'checkouts': fields.Integer(example=42, required=True),
+    'timeouts': fields.Integer(example=0, required=True),
+    'wait_time': fields.Float(example=0.5, required=True, help='Seconds spent waiting for a connection'),
+    'max_wait_time': fields.Float(example=0.1, required=True),
+})
+
+api_model_database_replica_stats = api.model('DatabaseReplicaStats', {
+    'lag': fields.Float(example=0.02, required=False, help='Seconds, as last measured; null when unknown'),
+    'pool': fields.Nested(api_model_database_pool_stats, required=True),
+})
+
+api_model_file_store_stats = api.model('FileStoreStats', {
+    'hits': fields.Integer(example=40, required=True),
+    'misses': fields.Integer(example=2, required=True),
+    'size': fields.Integer(example=1048576, required=False, help='Bytes, as last counted; null until counted'),
+})
+
+api_model_metrics = api.model('Metrics', {
+    'endpoints': fields.List(fields.Nested(api_model_endpoint_metrics), required=True),
+    'audit': fields.Nested(api_model_audit_stats, required=True, help='Logging of the HTTP requests'),
+    'database_pool': fields.Nested(api_model_database_pool_stats, required=True),
+    'database_read_pool': fields.Nested(api_model_database_pool_stats, required=True),
+    'database_replica': fields.Nested(api_model_database_replica_stats, required=False, allow_null=True),
+    'stamp_store': fields.Nested(api_model_file_store_stats, required=True, help='Cache of the rendered stamps'),
+})
+
+
+@api.route('/metrics')
+class MetricsResource(Resource):
+    @api.marshal_with(api_model_metrics)
+    def get(self) -> Any:
+        with request_session_context() as session:
+            me = authenticate(session)
+            need_admin(me)
+            # only the requests handled by this process
+            return {
+                'endpoints': metrics_json(),
+                'audit': audit_writer.stats(),
+                'database_pool': pool_stats(engine),
+                'database_read_pool': pool_stats(read_engine),
+                'database_replica': replica_stats(),
+                'stamp_store': stamp_store.stats(),
+            }
+
 
 @api.route('/missing-i18n-key')
 @api.doc(security=None)
 class MissingI18nKeyResource(Resource):
     @api.marshal_with(api_model_missing_i18n_key_event_list)
     def get(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
-            group_by = (
-                MissingI18nKey.language,
-                MissingI18nKey.namespace,
-                MissingI18nKey.key,
+            counts = (
+                session
+                .query(MissingI18nKeyCount)
+                .order_by(MissingI18nKeyCount.language, MissingI18nKeyCount.namespace, MissingI18nKeyCount.key)
+                .all()
             )
-            events = session.query(*group_by, func.count(MissingI18nKey.id)).group_by(*group_by).all()
             return {
                 'events': [
                     {
-                        'language': language,
-                        'namespace': namespace,
-                        'key': key,
-                        'count': count,
+                        'language': count.language,
+                        'namespace': count.namespace,
+                        'key': count.key,
+                        'count': count.count,
                     }
-                    for (language, namespace, key, count) in events
+                    for count in counts
                 ],
             }
 
@@ -335,13 +471,27 @@ class MissingI18nKeyResource(Resource):
     @api.expect(post_model, validate=True)
     @api.response(204, 'Success')
     def post(self) -> Any:
-        with session_context() as session:
-            missing_i18n_key = MissingI18nKey(
-                language=request.json['language'],
-                namespace=request.json['namespace'],
-                key=request.json['key'],
-            )
-            session.add(missing_i18n_key)
+        with request_session_context() as session:
+            record_missing_i18n_keys(session, [request.json])
+            session.commit()
+            return None, 204
+
+
+@api.route('/missing-i18n-keys')
+@api.doc(security=None)
+class MissingI18nKeysResource(Resource):
+    post_model = api.model('MissingI18nKeysPost', {
+        'events': fields.List(fields.Nested(MissingI18nKeyResource.post_model), required=True),
+    })
+
+    @api.expect(post_model, validate=True)
+    @api.response(204, 'Success')
+    def post(self) -> Any:
+        events = request.json['events']
+        if len(events) > MISSING_I18N_KEY_BATCH_SIZE:
+            abort(400, f'Send at most {MISSING_I18N_KEY_BATCH_SIZE} events at once')
+        with request_session_context() as session:
+            record_missing_i18n_keys(session, events)
             session.commit()
             return None, 204
 
@@ -357,26 +507,38 @@ class LoginResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_login_info, skip_none=True)
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             user = session.query(User).filter(User.username == request.json['username']).one_or_none()
-            if user is None or user.password != request.json['password']:
+            if user is None:
                 abort(401, 'Invalid credentials')
+            try:
+                valid, new_password = verify_password(request.json['password'], user.password)
+            except PasswordQueueFullError:
+                abort(503, 'Too many logins at once, try again later')
+            if not valid:
+                abort(401, 'Invalid credentials')
+            if new_password is not None:
+                # hashed with other parameters than the current ones
+                user.password = new_password
             last_login = user.last_login
             user.last_login = datetime.now(timezone.utc)
             missing_i18n_key_events_since_last_login = None
             if user.is_admin:
-                events_since_last_login = session.query(MissingI18nKey)
-                if last_login is not None:
-                    events_since_last_login = events_since_last_login.filter(MissingI18nKey.created >= last_login)
-                total = events_since_last_login.count()
+                if last_login is None:
+                    total, unique = session.query(
+                        func.coalesce(func.sum(MissingI18nKeyCount.count), 0),
+                        func.count(),
+                    ).one()
+                else:
+                    # on the indexes of the recent events and of the recent keys
+                    total = session.query(MissingI18nKey).filter(MissingI18nKey.created >= last_login).count()
+                    unique = session.query(MissingI18nKeyCount).filter(
+                        MissingI18nKeyCount.last_seen >= last_login,
+                    ).count()
                 if total > 0:
                     missing_i18n_key_events_since_last_login = {
                         'total': total,
-                        'unique': events_since_last_login.distinct(
-                            MissingI18nKey.language,
-                            MissingI18nKey.namespace,
-                            MissingI18nKey.key,
-                        ).count(),  # type: ignore
+                        'unique': unique,
                     }
             session.commit()
             payload = {
@@ -392,7 +554,26 @@ class LoginResource(Resource):
             }
 
 
-def authenticate(session: Session) -> User:
+# set after writing, so that the client reads its changes from the primary
+# until the replica has them
+READ_PRIMARY_COOKIE = 'read_primary'
+
+
+def request_session_context() -> AbstractContextManager[scoped_session]:
+    # the GET handlers only read
+    if request.method not in ('GET', 'HEAD'):
+        return session_context()
+    return session_context(read_only=True, from_replica=READ_PRIMARY_COOKIE not in request.cookies)
+
+
+@blueprint.after_request
+def stick_to_primary(response: Response) -> Response:
+    if request.method not in ('GET', 'HEAD') and response.status_code < HTTPStatus.BAD_REQUEST and has_replica():
+        response.set_cookie(READ_PRIMARY_COOKIE, '1', max_age=REPLICA_STICKINESS, httponly=True, samesite='Strict')
+    return response
+
+
+def authenticate(session: Session) -> Principal:
     # fetch token
     authorization = request.headers.get('Authorization')
     if authorization is None:
@@ -411,30 +592,48 @@ def authenticate(session: Session) -> User:
         abort(401, 'Token has expired')
     except jwt.exceptions.InvalidTokenError:
         abort(401, 'Token invalid')
+    principal = get_cached_principal(token)
+    if principal is not None:
+        return principal
     # fetch user
     user_id = payload.get('user_id')
     assert user_id is not None
-    user = session.query(User).get(user_id)
+    # most handlers then check user.student
+    user: User | None = (
+        session  # type: ignore
+        .query(User)
+        .options(joinedload(User.student))
+        .get(user_id)
+    )
     if user is None:
         abort(401, f'User {user_id} not found')
-    return user
+    principal = Principal.of_user(user)
+    cache_principal(token, principal)
+    return principal
 
 
-def need_admin(user: User) -> None:
+def need_admin(user: Principal) -> None:
     if not user.is_admin:
         abort(403, 'This action can only be performed by an administrator')
 
 
-def authorize(user: User, authorized: bool) -> None:
+def authorize(user: Principal, authorized: bool) -> None:
     if not user.is_admin and not authorized:
         abort(403, 'This action can not be performed by this user')
 
 
+def hash_password_or_abort(secret: str) -> Password:
+    try:
+        return hash_password(secret)
+    except PasswordQueueFullError:
+        abort(503, 'Too many passwords being hashed, try again later')
+
+
 @users_ns.route('/users')
 class UsersResource(Resource):
     @api.marshal_with(api_model_user_list)
     def get(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             users = session.query(User).all()
@@ -451,12 +650,12 @@ class UsersResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_user_one)
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             user = User(
                 username=request.json['username'],
-                password=request.json['password'],
+                password=hash_password_or_abort(request.json['password']),
                 is_admin=request.json['is_admin'],
             )
             session.add(user)
@@ -476,7 +675,7 @@ class UsersResource(Resource):
 class UserResource(Resource):
     @api.marshal_with(api_model_user_one)
     def get(self, user_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             authorize(me, me.id == user_id)
             user = session.query(User).get(user_id)
@@ -495,7 +694,7 @@ class UserResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_user_one)
     def put(self, user_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             user = session.query(User).get(user_id)
@@ -506,7 +705,7 @@ class UserResource(Resource):
                 user.username = username
             password = request.json.get('password')
             if password is not None:
-                user.password = password
+                user.password = hash_password_or_abort(password)
             is_admin = request.json.get('is_admin')
             if is_admin is not None:
                 user.is_admin = is_admin
@@ -517,13 +716,14 @@ class UserResource(Resource):
                     abort(409, f'User with username "{username}" already exists')
                 else:
                     raise
+            forget_principals(user_id)
             return {
                 'user': user.json(),
             }
 
     @api.response(204, 'Success')
     def delete(self, user_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             user = session.query(User).get(user_id)
@@ -531,6 +731,7 @@ class UserResource(Resource):
                 abort(404, f'User {user_id} not found')
             session.query(User).filter(User.id == user_id).delete()
             session.commit()
+            forget_principals(user_id)
             return None, 204
 
 
@@ -538,7 +739,7 @@ class UserResource(Resource):
 class LevelsResource(Resource):
     @api.marshal_with(api_model_level_list)
     def get(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             return {
@@ -555,7 +756,7 @@ class LevelsResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_level_one)
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             level = Level(name=request.json['name'])
@@ -570,17 +771,16 @@ class LevelsResource(Resource):
 class LevelResource(Resource):
     @api.marshal_with(api_model_class_list)
     def get(self, level_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             level = session.query(Level).get(level_id)
             if level is None:
                 abort(404, f'Level {level_id} not found')
-            belts = session.query(Belt).all()
-            skill_domains = session.query(SkillDomain).all()
+            reference_data = get_reference_data(session)
             return {
-                'belts': [belt.json() for belt in belts],
-                'skill_domains': [skill_domain.json() for skill_domain in skill_domains],
+                'belts': reference_data.belts,
+                'skill_domains': reference_data.skill_domains,
                 'level': level.json(),
                 'classes': [
                     class_.json()
@@ -599,7 +799,7 @@ class LevelResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_level_one)
     def put(self, level_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             level = session.query(Level).get(level_id)
@@ -615,17 +815,50 @@ class LevelResource(Resource):
 
     @api.response(204, 'Success')
     def delete(self, level_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
-            level = session.query(Level).get(level_id)
+            level = session.query(Level).filter(Level.id == level_id).with_for_update().one_or_none()
             if level is None:
                 abort(404, f'Level {level_id} not found')
+            files = files_of_exams(session, Exam.level_id == level.id)
             session.query(Level).filter(Level.id == level.id).delete()
             session.commit()
+            # students were deleted along
+            forget_principals()
+            forget_files_of_exams(session, files)
             return None, 204
 
 
+def lock_blob(session: Session, file_hash: str) -> None:
+    # until the end of the transaction; serializes the exams that add and
+    # remove references to the same content
+    session.execute(select(func.pg_advisory_xact_lock(func.hashtext(file_hash))))
+
+
+def delete_unused_blob(session: Session, file_hash: str) -> None:
+    # in a transaction of its own, after the one that removed a reference, so
+    # that the content is only deleted once no committed exam uses it
+    lock_blob(session, file_hash)
+    if session.query(Exam).filter(Exam.file_hash == file_hash).count() == 0:
+        blob_store.delete(file_hash)
+    session.commit()
+
+
+def files_of_exams(session: Session, criterion: Any) -> list[tuple[int, str]]:
+    # the exams deleted along with what they belong to, which must be locked
+    # first, so that no exam is added to it in the meantime
+    return list(session.query(Exam.id, Exam.file_hash).filter(criterion))
+
+
+def forget_files_of_exams(session: Session, files: list[tuple[int, str]]) -> None:
+    # after the commit that deleted the exams
+    for file_hash in sorted({file_hash for _, file_hash in files}):
+        delete_unused_blob(session, file_hash)
+    for exam_id, _ in files:
+        forget_stamped_exams_of_exam(exam_id)
+
+
 @level_ns.route('/levels/<int:level_id>/exams')
 class LevelExamsResource(Resource):
     parser = api.parser()
@@ -638,7 +871,7 @@ class LevelExamsResource(Resource):
     @api.marshal_with(api_model_exam_one)
     @api.expect(parser)
     def post(self, level_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             level = session.query(Level).get(level_id)
@@ -665,16 +898,28 @@ class LevelExamsResource(Resource):
             if skill_domain is None:
                 abort(404, f'Skill domain {skill_domain_id} not found')
 
-            exam = Exam(
-                level_id=level.id,
-                belt_id=belt.id,
-                skill_domain_id=skill_domain.id,
-                code=request.form['code'],
-                filename=request.form['filename'],
-                file=file.read(),
-            )
-            session.add(exam)
-            session.commit()
+            # stream the upload to the blob store
+            file_hash = blob_store.put(file.stream)
+            try:
+                lock_blob(session, file_hash)
+                # the same content may have been deleted since it was put
+                if file_hash not in blob_store:
+                    file.stream.seek(0)
+                    blob_store.put(file.stream)
+                exam = Exam(
+                    level_id=level.id,
+                    belt_id=belt.id,
+                    skill_domain_id=skill_domain.id,
+                    code=request.form['code'],
+                    filename=request.form['filename'],
+                    file_hash=file_hash,
+                )
+                session.add(exam)
+                session.commit()
+            except Exception:
+                session.rollback()
+                delete_unused_blob(session, file_hash)
+                raise
             return {
                 'exam': exam.json(),
             }
@@ -690,7 +935,7 @@ class ClassesResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_class_one)
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             level_id = request.json['level_id']
@@ -713,38 +958,49 @@ class ClassesResource(Resource):
 class ClassResource(Resource):
     @api.marshal_with(api_model_student_list)
     def get(self, class_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             authorize(me, me.student is not None and me.student.class_id == class_id)
-            class_ = session.query(Class).get(class_id)
+            # load everything upfront: the class with its level, then the
+            # students with their users
+            class_ = (
+                session  # type: ignore
+                .query(Class)
+                .options(
+                    joinedload(Class.level),
+                    selectinload(Class.students).joinedload(Student.user),
+                )
+                .filter(Class.id == class_id)
+                .one_or_none()
+            )
             if class_ is None:
                 abort(404, f'Class {class_id} not found')
             level = class_.level
 
-            evaluations = (
+            # highest belt of each student in each skill domain
+            progress = (
                 session  # type: ignore
-                .query(Evaluation)
-                .filter(Evaluation.success)
-                .outerjoin(Student)
+                .query(StudentProgress.student_id, StudentProgress.skill_domain_id, StudentProgress.belt_id)
+                .join(Student)
+                .filter(StudentProgress.belt_id.isnot(None))  # type: ignore
                 .filter(Student.class_id == class_id)
                 .all()
             )
 
-            belts = session.query(Belt).all()
-            skill_domains = session.query(SkillDomain).all()
+            reference_data = get_reference_data(session)
             students = class_.students
 
             # collect results
             belts_of_students: dict[int, list[dict[str, int]]] = {}
-            for evaluation in evaluations:
-                belts_of_students.setdefault(evaluation.student_id, []).append({
-                    'skill_domain_id': evaluation.skill_domain_id,
-                    'belt_id': evaluation.belt_id,
+            for student_id, skill_domain_id, belt_id in progress:
+                belts_of_students.setdefault(student_id, []).append({
+                    'skill_domain_id': skill_domain_id,
+                    'belt_id': belt_id,
                 })
 
             return {
-                'belts': [belt.json() for belt in belts],
-                'skill_domains': [skill_domain.json() for skill_domain in skill_domains],
+                'belts': reference_data.belts,
+                'skill_domains': reference_data.skill_domains,
                 'students': [student.json() for student in students],
                 'level': level.json(),
                 'class': class_.json(),
@@ -764,7 +1020,7 @@ class ClassResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_class_one)
     def put(self, class_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             class_ = session.query(Class).get(class_id)
@@ -782,7 +1038,7 @@ class ClassResource(Resource):
 
     @api.response(204, 'Success')
     def delete(self, class_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             class_ = session.query(Class).get(class_id)
@@ -790,43 +1046,160 @@ class ClassResource(Resource):
                 abort(404, f'Class {class_id} not found')
             session.query(Class).filter(Class.id == class_.id).delete()
             session.commit()
+            # students were deleted along
+            forget_principals()
             return None, 204
 
 
+def class_waitlist_mappings(session: Session, class_id: int) -> Any:
+    waitlist_entries = (
+        session  # type: ignore
+        .query(WaitlistEntry)
+        .outerjoin(Student)
+        .filter(Student.class_id == class_id)
+        .all()
+    )
+
+    # collect results
+    waitlist_entries_of_students: dict[int, list[dict[str, int]]] = {}
+    for waitlist_entry in waitlist_entries:
+        waitlist_entries = waitlist_entries_of_students.setdefault(waitlist_entry.student_id, [])
+        waitlist_entries.append(waitlist_entry.json())
+
+    return {
+        'waitlist_mappings': [
+            {
+                'student_id': student_id,
+                'waitlist_entries': waitlist_entries,
+            }
+            for student_id, waitlist_entries in waitlist_entries_of_students.items()
+        ],
+    }
+
+
 @class_ns.route('/classes/<int:class_id>/waitlist')
 class ClassWaitlistResource(Resource):
     @api.marshal_with(api_model_waitlist_mapping_list)
     def get(self, class_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             class_ = session.query(Class).get(class_id)
             if class_ is None:
                 abort(404, f'Class {class_id} not found')
+            return class_waitlist_mappings(session, class_id)
 
-            waitlist_entries = (
-                session  # type: ignore
-                .query(WaitlistEntry)
-                .outerjoin(Student)
-                .filter(Student.class_id == class_id)
-                .all()
-            )
+    put_model_waitlist_entry = api.model('ClassWaitlistPutWaitlistEntry', {
+        'student_id': fields.Integer(example=42, required=True),
+        'skill_domain_id': fields.Integer(example=42, required=True),
+        'belt_id': fields.Integer(example=42, required=True),
+    })
 
-            # collect results
-            waitlist_entries_of_students: dict[int, list[dict[str, int]]] = {}
-            for waitlist_entry in waitlist_entries:
-                waitlist_entries = waitlist_entries_of_students.setdefault(waitlist_entry.student_id, [])
-                waitlist_entries.append(waitlist_entry.json())
+    put_model = api.model('ClassWaitlistPut', {
+        'waitlist_entries': fields.List(fields.Nested(put_model_waitlist_entry), required=True),
+    })
 
-            return {
-                'waitlist_mappings': [
+    @api.expect(put_model, validate=True)
+    @api.marshal_with(api_model_waitlist_mapping_list)
+    def put(self, class_id: int) -> Any:
+        # replace the waitlist of the whole class, keeping the unchanged entries
+        with request_session_context() as session:
+            me = authenticate(session)
+            need_admin(me)
+            class_ = session.query(Class).get(class_id)
+            if class_ is None:
+                abort(404, f'Class {class_id} not found')
+            desired = {
+                (entry['student_id'], entry['skill_domain_id']): entry['belt_id']
+                for entry in request.json['waitlist_entries']
+            }
+            if len(desired) != len(request.json['waitlist_entries']):
+                abort(400, 'Several waitlist entries for the same student and skill domain')
+
+            student_ids = {
+                student_id
+                for student_id, in session.query(Student.id).filter(Student.class_id == class_id)
+            }
+            unknown_student_ids = {student_id for student_id, _ in desired} - student_ids
+            if unknown_student_ids:
+                abort(404, f'Students {sorted(unknown_student_ids)} not found in class {class_id}')
+            reference_data = get_reference_data(session)
+            belts = {belt['id']: belt for belt in reference_data.belts}
+            skill_domains = {skill_domain['id']: skill_domain for skill_domain in reference_data.skill_domains}
+            for (_, skill_domain_id), belt_id in sorted(desired.items()):
+                if belt_id not in belts:
+                    abort(404, f'Belt {belt_id} not found')
+                if skill_domain_id not in skill_domains:
+                    abort(404, f'Skill domain {skill_domain_id} not found')
+
+            existing = {
+                (waitlist_entry.student_id, waitlist_entry.skill_domain_id): waitlist_entry
+                for waitlist_entry in (
+                    session  # type: ignore
+                    .query(WaitlistEntry)
+                    .join(Student)
+                    .filter(Student.class_id == class_id)
+                )
+            }
+            new = {
+                pair: belt_id
+                for pair, belt_id in desired.items()
+                if pair not in existing or existing[pair].belt_id != belt_id
+            }
+
+            # only the new entries must be for the belt after the achieved one
+            achieved_ranks = {
+                (student_id, skill_domain_id): rank
+                for student_id, skill_domain_id, rank in (
+                    session  # type: ignore
+                    .query(StudentProgress.student_id, StudentProgress.skill_domain_id, Belt.rank)
+                    .join(Belt, Belt.id == StudentProgress.belt_id)
+                    .join(Student, Student.id == StudentProgress.student_id)
+                    .filter(Student.class_id == class_id)
+                )
+            }
+            errors = []
+            for (student_id, skill_domain_id), belt_id in sorted(new.items()):
+                belt = belts[belt_id]
+                achieved_rank = achieved_ranks.get((student_id, skill_domain_id), 0)
+                if belt['rank'] != achieved_rank + 1:
+                    errors.append(
+                        f'student {student_id} cannot register for {belt["name"]} (rank: {belt["rank"]}) '
+                        f'in {skill_domains[skill_domain_id]["name"]} after reaching rank {achieved_rank}',
+                    )
+            if errors:
+                abort(409, 'Invalid waitlist: ' + ', '.join(errors))
+
+            removed_ids = [
+                waitlist_entry.id
+                for pair, waitlist_entry in existing.items()
+                if pair not in desired or pair in new
+            ]
+            if removed_ids:
+                (
+                    session
+                    .query(WaitlistEntry)
+                    .filter(WaitlistEntry.id.in_(removed_ids))
+                    .delete(synchronize_session=False)
+                )
+            if new:
+                session.execute(insert(WaitlistEntry).values([
                     {
                         'student_id': student_id,
-                        'waitlist_entries': waitlist_entries,
+                        'skill_domain_id': skill_domain_id,
+                        'belt_id': belt_id,
                     }
-                    for student_id, waitlist_entries in waitlist_entries_of_students.items()
-                ],
-            }
+                    for (student_id, skill_domain_id), belt_id in sorted(new.items())
+                ]))
+            try:
+                session.commit()
+            except IntegrityError as e:
+                session.rollback()
+                if isinstance(e.orig, UniqueViolation):
+                    abort(409, f'Waitlist of class {class_id} changed concurrently')
+                else:
+                    raise
+            return class_waitlist_mappings(session, class_id)
 
 
 @class_ns.route('/classes/<int:class_id>/exam-pdf')
@@ -838,7 +1211,7 @@ class ClassExamPDFResource(Resource):
     @api.expect(post_model, validate=True)
     @api.response(200, 'Success')
     def post(self, class_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             class_ = session.query(Class).get(class_id)
@@ -852,13 +1225,96 @@ class ClassExamPDFResource(Resource):
             exams_with_names, errors = exams_to_print(session, waitlist_entry_ids)
             if errors:
                 abort(422, '\n'.join(errors))
-            with NamedTemporaryFile(suffix='pdf') as tmpfile:
-                print_exams_as_pdf(full_class_name, exams_with_names, tmpfile.name)
-                return send_file(
-                    BytesIO(tmpfile.read()),
-                    as_attachment=True,
-                    attachment_filename='exam.pdf',
-                )
+            with NamedTemporaryFile(suffix='.pdf', delete=False) as tmpfile:
+                path = tmpfile.name
+            try:
+                timings = print_exams_as_pdf(full_class_name, exams_with_names, path)
+                # send the document from disk; once unlinked, the file remains
+                # readable until the response closes it
+                pdf_file = open(path, 'rb')  # noqa: SIM115
+            finally:
+                remove(path)
+            response = send_file(  # type: ignore
+                pdf_file,
+                mimetype='application/pdf',
+                as_attachment=True,
+                download_name='exam.pdf',
+            )
+            response.content_length = fstat(pdf_file.fileno()).st_size
+            response.headers['Server-Timing'] = ', '.join(
+                f'{stage};dur={duration * 1000:.1f}' for stage, duration in timings.items()
+            )
+            return response
+
+
+@class_ns.route('/classes/<int:class_id>/exam-pdf-jobs')
+class ClassExamPDFJobsResource(Resource):
+    post_model = api.model('ClassExamPdfJobsPost', {
+        'waitlist_entry_ids': fields.List(fields.Integer),
+    })
+
+    @api.expect(post_model, validate=True)
+    @api.marshal_with(api_model_exam_pdf_job_one, code=202)
+    def post(self, class_id: int) -> Any:
+        with request_session_context() as session:
+            me = authenticate(session)
+            need_admin(me)
+            class_ = session.query(Class).get(class_id)
+            if class_ is None:
+                abort(404, f'Class {class_id} not found')
+
+            level = class_.level
+            full_class_name = level.name + class_.name
+
+            waitlist_entry_ids = request.json['waitlist_entry_ids']
+            exams_with_names, errors = exams_to_print(session, waitlist_entry_ids)
+            if errors:
+                abort(422, '\n'.join(errors))
+            try:
+                job = submit_print_job(full_class_name, exams_with_names)
+            except QueueFullError:
+                abort(503, 'Too many exams being printed, try again later')
+            return {
+                'job': job,
+            }, 202
+
+
+def get_exam_pdf_job(job_id: str) -> Job:
+    job = get_job(job_id) if fullmatch('[0-9a-f]{64}', job_id) else None
+    if job is None:
+        abort(404, f'Job {job_id} not found')
+    return job
+
+
+@class_ns.route('/exam-pdf-jobs/<string:job_id>')
+class ExamPDFJobResource(Resource):
+    @api.marshal_with(api_model_exam_pdf_job_one, skip_none=True)
+    def get(self, job_id: str) -> Any:
+        with request_session_context() as session:
+            me = authenticate(session)
+            need_admin(me)
+            return {
+                'job': get_exam_pdf_job(job_id),
+            }
+
+
+@class_ns.route('/exam-pdf-jobs/<string:job_id>/pdf')
+class ExamPDFJobPDFResource(Resource):
+    @api.response(200, 'Success')
+    def get(self, job_id: str) -> Any:
+        with request_session_context() as session:
+            me = authenticate(session)
+            need_admin(me)
+            job = get_exam_pdf_job(job_id)
+            if job['status'] != 'done':
+                abort(409, f'Job {job_id} is {job["status"]}')
+            # supports Range and conditional requests
+            return send_file(  # type: ignore
+                job_result_path(job_id),
+                mimetype='application/pdf',
+                as_attachment=True,
+                download_name='exam.pdf',
+            )
 
 
 @students_ns.route('/students')
@@ -874,7 +1330,7 @@ class StudentsResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_student_one)
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             class_id = request.json['class_id']
@@ -884,7 +1340,7 @@ class StudentsResource(Resource):
             level = class_.level
             user = User(
                 username=request.json['username'],
-                password=request.json['password'],
+                password=hash_password_or_abort(request.json['password']),
             )
             student = Student(
                 class_id=class_id,
@@ -900,6 +1356,7 @@ class StudentsResource(Resource):
                     abort(409, f'User with username "{request.json["username"]}" already exists')
                 else:
                     raise
+            warm_stamp_of_student(student.display_name, level.name + class_.name)
             return {
                 'level': level.json(),
                 'class': class_.json(),
@@ -920,7 +1377,7 @@ class StudentsResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_student_list_bare)
     def put(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             students_json = request.json['students']
@@ -929,6 +1386,8 @@ class StudentsResource(Resource):
                 Student.id.in_(student_json['id'] for student_json in students_json),
             ).all()
             session.commit()
+            for student in students:
+                forget_principals(student.user_id)
             return {
                 'students': [
                     student.json()
@@ -937,19 +1396,183 @@ class StudentsResource(Resource):
             }
 
 
+ROSTER_MAX_SIZE = 1000  # students
+
+
+def import_roster(class_id: int, rows: list[dict[str, Any]]) -> Any:
+    """
+    Create the students of a roster, skipping the usernames already taken
+
+    The users and the students are created with one INSERT each.
+    """
+    with request_session_context() as session:
+        me = authenticate(session)
+        need_admin(me)
+        class_ = session.query(Class).options(  # type: ignore
+            joinedload(Class.level),
+        ).filter(Class.id == class_id).one_or_none()
+        if class_ is None:
+            abort(404, f'Class {class_id} not found')
+
+        # report all the invalid rows at once
+        if len(rows) > ROSTER_MAX_SIZE:
+            abort(400, f'Rosters are limited to {ROSTER_MAX_SIZE} students')
+        errors = [
+            f'row {row_number} has no {field}'
+            for row_number, row in enumerate(rows, 1)
+            for field in ('username', 'password', 'display_name')
+            if not row[field]
+        ]
+        if errors:
+            abort(400, 'Invalid roster: ' + ', '.join(errors))
+
+        # usernames taken by existing users, or earlier in the roster
+        taken = {
+            username
+            for username, in session.query(User.username).filter(User.username.in_({row['username'] for row in rows}))
+        }
+        conflicts = []
+        new_rows = []
+        for row_number, row in enumerate(rows, 1):
+            if row['username'] in taken:
+                conflicts.append((row_number, row['username']))
+            else:
+                taken.add(row['username'])
+                new_rows.append((row_number, row))
+
+        student_ids = []
+        if new_rows:
+            try:
+                passwords = hash_passwords([row['password'] for _, row in new_rows])
+            except PasswordQueueFullError:
+                abort(503, 'Too many passwords being hashed, try again later')
+            # usernames taken since are skipped as well
+            user_ids = dict(session.execute(
+                insert(User).values([
+                    {
+                        'username': row['username'],
+                        'password': password,
+                        'is_admin': False,
+                    }
+                    for (_, row), password in zip(new_rows, passwords)
+                ]).on_conflict_do_nothing(index_elements=[User.username]).returning(User.username, User.id),
+            ).all())
+            students_values = []
+            for row_number, row in new_rows:
+                user_id = user_ids.get(row['username'])
+                if user_id is None:
+                    conflicts.append((row_number, row['username']))
+                    continue
+                students_values.append({
+                    'user_id': user_id,
+                    'class_id': class_.id,
+                    'display_name': row['display_name'],
+                    'can_register_to_waitlist': row['can_register_to_waitlist'],
+                })
+            if students_values:
+                student_ids = session.execute(
+                    insert(Student).values(students_values).returning(Student.id),
+                ).scalars().all()
+        session.commit()
+
+        students = (
+            session.query(Student)  # type: ignore
+            .options(joinedload(Student.user))
+            .filter(Student.id.in_(student_ids))
+            .order_by(Student.id)
+            .all()
+        )
+        warm_stamps_of_students(
+            [student.display_name for student in students],
+            class_.level.name + class_.name,
+        )
+        return {
+            'students': [student.json() for student in students],
+            'conflicts': [
+                {
+                    'row': row_number,
+                    'username': username,
+                }
+                for row_number, username in sorted(conflicts)
+            ],
+        }
+
+
+@students_ns.route('/students/import')
+class StudentsImportResource(Resource):
+    post_model_students = api.model('StudentsImportPostStudents', {
+        'username': fields.String(example='tartempion', required=True),
+        'password': fields.String(example='correct horse battery staple', required=True),
+        'display_name': fields.String(example='John Doe', required=True),
+        'can_register_to_waitlist': fields.Boolean(example=False, required=True),
+    })
+    post_model = api.model('StudentsImportPost', {
+        'class_id': fields.Integer(example=42, required=True),
+        'students': fields.List(fields.Nested(post_model_students), required=True),
+    })
+
+    @api.expect(post_model, validate=True)
+    @api.marshal_with(api_model_student_import)
+    def post(self) -> Any:
+        return import_roster(request.json['class_id'], request.json['students'])
+
+
+@students_ns.route('/students/import/csv')
+class StudentsImportCSVResource(Resource):
+    parser = api.parser()
+    parser.add_argument('class_id', type=int, location='form', required=True)
+    parser.add_argument(
+        'file',
+        type=FileStorage,
+        location='files',
+        required=True,
+        help='CSV with the columns username, password, display_name and optionally can_register_to_waitlist',
+    )
+
+    @api.marshal_with(api_model_student_import)
+    @api.expect(parser)
+    def post(self) -> Any:
+        try:
+            class_id = int(request.form['class_id'])
+        except (KeyError, ValueError):
+            abort(400, 'Invalid class id')
+        try:
+            file = request.files['file']
+        except (KeyError, ValueError):
+            abort(400, 'Invalid file')
+        try:
+            reader = DictReader(TextIOWrapper(file.stream, encoding='utf-8-sig'))
+            missing = {'username', 'password', 'display_name'} - set(reader.fieldnames or [])
+            if missing:
+                abort(400, 'Missing columns: ' + ', '.join(sorted(missing)))
+            rows = [
+                {
+                    'username': (row['username'] or '').strip(),
+                    'password': row['password'] or '',
+                    'display_name': (row['display_name'] or '').strip(),
+                    'can_register_to_waitlist': (
+                        (row.get('can_register_to_waitlist') or '').strip().lower() in ('1', 'true', 'yes')
+                    ),
+                }
+                for row in reader
+            ]
+        except (UnicodeDecodeError, CSVError) as e:
+            abort(400, f'Invalid CSV: {e}')
+        return import_roster(class_id, rows)
+
+
 @students_ns.route('/students/<int:student_id>')
 class StudentResource(Resource):
     @api.marshal_with(api_model_evaluation_list)
     def get(self, student_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             authorize(me, me.student is not None and me.student.id == student_id)
             student = session.query(Student).get(student_id)
             if student is None:
                 abort(404, f'Student {student_id} not found')
 
-            belts = session.query(Belt).all()
-            skill_domains = session.query(SkillDomain).all()
+            reference_data = get_reference_data(session)
             evaluations = session.query(Evaluation).filter(Evaluation.student_id == student.id).all()
             class_ = student.class_
             level = class_.level
@@ -957,8 +1580,8 @@ class StudentResource(Resource):
                 'level': level.json(),
                 'class': class_.json(),
                 'student': student.json(),
-                'belts': [belt.json() for belt in belts],
-                'skill_domains': [skill_domain.json() for skill_domain in skill_domains],
+                'belts': reference_data.belts,
+                'skill_domains': reference_data.skill_domains,
                 'evaluations': [evaluation.json() for evaluation in evaluations],
             }
 
@@ -973,13 +1596,14 @@ class StudentResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_student_one)
     def put(self, student_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             student = session.query(Student).get(student_id)
             if student is None:
                 abort(404, f'Student {student_id} not found')
             user = student.user
+            previous_display_name = student.display_name
             display_name = request.json.get('display_name')
             if display_name is not None:
                 student.display_name = display_name
@@ -991,13 +1615,17 @@ class StudentResource(Resource):
                 user.username = username
             password = request.json.get('password')
             if password:
-                user.password = password
+                user.password = hash_password_or_abort(password)
             rank = request.json.get('rank')
             if rank is not None:
                 student.rank = rank
             session.commit()
             class_ = student.class_
             level = class_.level
+            forget_principals(user.id)
+            if display_name is not None and display_name != previous_display_name:
+                forget_stamped_exams_of_student(previous_display_name, level.name + class_.name)
+                warm_stamp_of_student(student.display_name, level.name + class_.name)
             return {
                 'level': level.json(),
                 'class': class_.json(),
@@ -1007,7 +1635,7 @@ class StudentResource(Resource):
 
     @api.response(204, 'Success')
     def delete(self, student_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             student = session.query(Student).get(student_id)
@@ -1017,6 +1645,7 @@ class StudentResource(Resource):
             session.query(Student).filter(Student.id == student.id).delete()
             session.query(User).filter(User.id == user_id).delete()
             session.commit()
+            forget_principals(user_id)
             return None, 204
 
 
@@ -1024,7 +1653,7 @@ class StudentResource(Resource):
 class StudentWaitlistResource(Resource):
     @api.marshal_with(api_model_waitlist_entry_list)
     def get(self, student_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             authorize(me, me.student is not None and me.student.id == student_id)
             student = session.query(Student).get(student_id)
@@ -1045,7 +1674,7 @@ class StudentWaitlistResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_waitlist_entry_one)
     def post(self, student_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             authorize(
                 me,
@@ -1067,17 +1696,12 @@ class StudentWaitlistResource(Resource):
             if skill_domain is None:
                 abort(404, f'Skill domain {skill_domain_id} not found')
 
-            session.query(Evaluation).filter(Evaluation.success).subquery()
-
             achieved_belt = (
                 session  # type: ignore
                 .query(Belt)
-                .outerjoin(Evaluation)
-                .filter(Evaluation.student_id == student_id)
-                .filter(Evaluation.skill_domain_id == skill_domain.id)
-                .filter(Evaluation.success)
-                .order_by(Belt.rank.desc())
-                .limit(1)
+                .join(StudentProgress, StudentProgress.belt_id == Belt.id)
+                .filter(StudentProgress.student_id == student_id)
+                .filter(StudentProgress.skill_domain_id == skill_domain.id)
                 .one_or_none()
             )
             if achieved_belt:
@@ -1125,14 +1749,10 @@ class StudentWaitlistResource(Resource):
 class SkillDomainsResource(Resource):
     @api.marshal_with(api_model_skill_domain_list)
     def get(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             authenticate(session)
-            skill_domains = session.query(SkillDomain).all()
             return {
-                'skill_domains': [
-                    skill_domain.json()
-                    for skill_domain in skill_domains
-                ],
+                'skill_domains': get_reference_data(session).skill_domains,
             }
 
     post_model = api.model('SkillDomainsPost', {
@@ -1143,7 +1763,7 @@ class SkillDomainsResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_skill_domain_one)
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             skill_domain = SkillDomain(
@@ -1151,6 +1771,7 @@ class SkillDomainsResource(Resource):
                 code=request.json['code'],
             )
             session.add(skill_domain)
+            bump_reference_data_version(session)
             session.commit()
             return {
                 'skill_domain': skill_domain.json(),
@@ -1167,7 +1788,7 @@ class SkillDomainResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_skill_domain_one)
     def put(self, skill_domain_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             skill_domain = session.query(SkillDomain).get(skill_domain_id)
@@ -1179,6 +1800,7 @@ class SkillDomainResource(Resource):
             code = request.json.get('code')
             if code is not None:
                 skill_domain.code = code
+            bump_reference_data_version(session)
             session.commit()
             return {
                 'skill_domain': skill_domain.json(),
@@ -1186,25 +1808,66 @@ class SkillDomainResource(Resource):
 
     @api.response(204, 'Success')
     def delete(self, skill_domain_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
-            skill_domain = session.query(SkillDomain).get(skill_domain_id)
+            skill_domain = (
+                session
+                .query(SkillDomain)
+                .filter(SkillDomain.id == skill_domain_id)
+                .with_for_update()
+                .one_or_none()
+            )
             if skill_domain is None:
                 abort(404, f'Skill domain {skill_domain_id} not found')
+            files = files_of_exams(session, Exam.skill_domain_id == skill_domain.id)
             session.query(SkillDomain).filter(SkillDomain.id == skill_domain.id).delete()
+            bump_reference_data_version(session)
             session.commit()
+            forget_files_of_exams(session, files)
             return None, 204
 
 
+def max_belt_rank(session: scoped_session) -> int:
+    # the ranks go from 1 to the number of belts, which are cached
+    return len(get_reference_data(session).belts)
+
+
+# constraints of the belt ranks, checked at commit
+BELT_RANK_CONSTRAINTS = {'belt_rank_key', 'belt_rank_positive'}
+# raised by the belt_ranks_dense trigger, without a constraint name
+BELT_RANKS_DENSE_MESSAGE = 'Belt ranks do not go from 1 to the number of belts'
+
+
+def violates_belt_ranks(e: IntegrityError) -> bool:
+    error: Any = e.orig
+    if error.diag.constraint_name in BELT_RANK_CONSTRAINTS:
+        return True
+    return bool(
+        error.pgcode == errorcodes.INTEGRITY_CONSTRAINT_VIOLATION and
+        error.diag.message_primary == BELT_RANKS_DENSE_MESSAGE,
+    )
+
+
+def commit_belt_ranks(session: Session) -> None:
+    # the ranks are checked at commit
+    try:
+        session.commit()
+    except IntegrityError as e:
+        if violates_belt_ranks(e):
+            abort(409, 'The belts were changed at the same time, try again')
+        else:
+            raise
+
+
 @belts_ns.route('/belts')
 class BeltsResource(Resource):
     @api.marshal_with(api_model_belt_list)
     def get(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             authenticate(session)
             return {
-                'belts': [belt.json() for belt in session.query(Belt)],
+                'belts': get_reference_data(session).belts,
             }
 
     post_model = api.model('BeltsPost', {
@@ -1216,22 +1879,18 @@ class BeltsResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_belt_one)
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
-            # TODO: store this information somewhere
-            max_rank: int = session.query(func.max(Belt.rank)).scalar()  # type: ignore
-            # no belt in database
-            if max_rank is None:
-                max_rank = 0
             belt = Belt(
                 name=request.json['name'],
-                rank=max_rank + 1,
+                rank=max_belt_rank(session) + 1,
                 code=request.json.get('code', ''),
                 color=request.json.get('color', ''),
             )
             session.add(belt)
-            session.commit()
+            bump_reference_data_version(session)
+            commit_belt_ranks(session)
             return {
                 'belt': belt.json(),
             }
@@ -1248,7 +1907,7 @@ class BeltResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_belt_one)
     def put(self, belt_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             belt = session.query(Belt).get(belt_id)
@@ -1263,6 +1922,7 @@ class BeltResource(Resource):
             color = request.json.get('color')
             if color is not None:
                 belt.color = color
+            bump_reference_data_version(session)
             session.commit()
             return {
                 'belt': belt.json(),
@@ -1270,12 +1930,15 @@ class BeltResource(Resource):
 
     @api.response(204, 'Success')
     def delete(self, belt_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
-            belt = session.query(Belt).get(belt_id)
+            belt = session.query(Belt).filter(Belt.id == belt_id).with_for_update().one_or_none()
             if belt is None:
                 abort(404, f'Belt {belt_id} not found')
+            # the evaluations and the exams of the belt are deleted along
+            progress_to_refresh = progress_of_belts(session, [belt.id])
+            files = files_of_exams(session, Exam.belt_id == belt.id)
             (
                 session
                 .query(Belt)
@@ -1283,7 +1946,10 @@ class BeltResource(Resource):
                 .update({Belt.rank: Belt.rank - 1})
             )
             session.query(Belt).filter(Belt.id == belt.id).delete()
-            session.commit()
+            refresh_student_progress(session, progress_to_refresh)
+            bump_reference_data_version(session)
+            commit_belt_ranks(session)
+            forget_files_of_exams(session, files)
             return None, 204
 
 
@@ -1304,7 +1970,7 @@ class BeltRankResource(Resource):
         if other_belt_id is not None and increase_by is not None:
             abort(400, 'Only provide one of other_belt_id, increase_by')
 
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             belt = session.query(Belt).get(belt_id)
@@ -1316,7 +1982,10 @@ class BeltRankResource(Resource):
                 if other_belt is None:
                     abort(404, f'Belt {other_belt_id} not found')
                 belt.exchange_ranks(other_belt)
-                session.commit()
+                session.flush()
+                refresh_student_progress(session, progress_of_belts(session, [belt.id, other_belt.id]))
+                bump_reference_data_version(session)
+                commit_belt_ranks(session)
             else:
                 assert increase_by is not None
                 rank = belt.rank + increase_by
@@ -1330,13 +1999,15 @@ class BeltRankResource(Resource):
                         .update({Belt.rank: Belt.rank + 1})
                     )
                     belt.rank = rank
-                    session.commit()
+                    session.flush()
+                    # only the order of this belt relative to the others changed
+                    refresh_student_progress(session, progress_of_belts(session, [belt.id]))
+                    bump_reference_data_version(session)
+                    commit_belt_ranks(session)
                 elif increase_by == 0:
                     pass
                 else:
-                    # TODO: store this information somewhere
-                    max_rank: int = session.query(func.max(Belt.rank)).scalar()  # type: ignore
-                    if rank > max_rank:
+                    if rank > max_belt_rank(session):
                         abort(400, f"Cannot increase belt'rank {belt_id} by {increase_by}")
                     (
                         session
@@ -1345,13 +2016,52 @@ class BeltRankResource(Resource):
                         .update({Belt.rank: Belt.rank - 1})
                     )
                     belt.rank = rank
-                    session.commit()
+                    session.flush()
+                    # only the order of this belt relative to the others changed
+                    refresh_student_progress(session, progress_of_belts(session, [belt.id]))
+                    bump_reference_data_version(session)
+                    commit_belt_ranks(session)
 
             return {
                 'belt': belt.json(),
             }
 
 
+@belts_ns.route('/belts/ranks')
+class BeltRanksResource(Resource):
+    put_model = api.model('BeltRanks', {
+        'belt_ids': fields.List(fields.Integer(example=42), required=True, description='All the belts, in order'),
+    })
+
+    @api.expect(put_model, validate=True)
+    @api.marshal_with(api_model_belt_list)
+    def put(self) -> Any:
+        belt_ids = request.json['belt_ids']
+        with request_session_context() as session:
+            me = authenticate(session)
+            need_admin(me)
+            ranks = {belt['id']: belt['rank'] for belt in get_reference_data(session).belts}
+            if len(belt_ids) != len(set(belt_ids)) or set(belt_ids) != ranks.keys():
+                abort(400, 'Do provide each belt exactly once')
+            new_ranks = {belt_id: rank for rank, belt_id in enumerate(belt_ids, 1)}
+            moved_belt_ids = [belt_id for belt_id, rank in new_ranks.items() if ranks[belt_id] != rank]
+            if moved_belt_ids:
+                # the students whose highest belt might change
+                progress_to_refresh = progress_of_belts(session, moved_belt_ids)
+                (
+                    session
+                    .query(Belt)
+                    .filter(Belt.id.in_(moved_belt_ids))
+                    .update({Belt.rank: case(new_ranks, value=Belt.id)}, synchronize_session=False)
+                )
+                refresh_student_progress(session, progress_to_refresh)
+                bump_reference_data_version(session)
+                commit_belt_ranks(session)
+            return {
+                'belts': get_reference_data(session).belts,
+            }
+
+
 @evaluations_ns.route('/evaluations')
 class EvaluationsResource(Resource):
     post_model = api.model('EvaluationsPost', {
@@ -1365,7 +2075,7 @@ class EvaluationsResource(Resource):
     @api.expect(post_model, validate=True)
     @api.marshal_with(api_model_evaluation_one)
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             student_id = request.json['student_id']
@@ -1393,6 +2103,8 @@ class EvaluationsResource(Resource):
                 success=request.json['success'],
             )
             session.add(evaluation)
+            session.flush()
+            refresh_student_progress(session, [(student_id, skill_domain_id)])
             session.commit()
             class_ = student.class_
             level = class_.level
@@ -1419,12 +2131,13 @@ class EvaluationResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_evaluation_one)
     def put(self, evaluation_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             evaluation = session.query(Evaluation).get(evaluation_id)
             if evaluation is None:
                 abort(404, f'Evaluation {evaluation_id} not found')
+            previous_progress = (evaluation.student_id, evaluation.skill_domain_id)
             student_id = request.json.get('student_id')
             if student_id is not None:
                 student = session.query(Student).get(student_id)
@@ -1459,6 +2172,8 @@ class EvaluationResource(Resource):
             success = request.json.get('success')
             if success is not None:
                 evaluation.success = success
+            session.flush()
+            refresh_student_progress(session, [previous_progress, (evaluation.student_id, evaluation.skill_domain_id)])
             session.commit()
             class_ = student.class_
             level = class_.level
@@ -1473,13 +2188,14 @@ class EvaluationResource(Resource):
 
     @api.response(204, 'Success')
     def delete(self, evaluation_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             evaluation = session.query(Evaluation).get(evaluation_id)
             if evaluation is None:
                 abort(404, f'Evaluation {evaluation_id} not found')
             session.query(Evaluation).filter(Evaluation.id == evaluation.id).delete()
+            refresh_student_progress(session, [(evaluation.student_id, evaluation.skill_domain_id)])
             session.commit()
             return None, 204
 
@@ -1488,7 +2204,7 @@ class EvaluationResource(Resource):
 class WaitlistResource(Resource):
     @api.response(204, 'Success')
     def delete(self, waitlist_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             waitlist_entry = session.query(WaitlistEntry).get(waitlist_id)
             if waitlist_entry is None:
@@ -1520,29 +2236,69 @@ class WaitlistConvertResource(Resource):
     @api.expect(post_model, validate=True)
     @api.response(204, 'Success')
     def post(self) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             completed_evaluations = request.json['completed_evaluations']
+            dates = {}
             for completed_evaluation in completed_evaluations:
                 date_string = completed_evaluation['date']
                 try:
-                    date_value = date.fromisoformat(date_string)
+                    dates[date_string] = date.fromisoformat(date_string)
                 except ValueError:
                     abort(400, f'Invalid date {date_string}')
+            waitlist_entry_ids = [
+                completed_evaluation['waitlist_entry_id']
+                for completed_evaluation in completed_evaluations
+            ]
+            if len(set(waitlist_entry_ids)) != len(waitlist_entry_ids):
+                abort(400, 'Several evaluations for the same waitlist entry')
+            if not waitlist_entry_ids:
+                return None, 204
+
+            # a concurrent conversion of the same entries waits for this one,
+            # and then no longer finds them
+            waitlist_entries = {
+                waitlist_entry.id: waitlist_entry
+                for waitlist_entry in (
+                    session
+                    .query(
+                        WaitlistEntry.id,
+                        WaitlistEntry.student_id,
+                        WaitlistEntry.skill_domain_id,
+                        WaitlistEntry.belt_id,
+                    )
+                    .filter(WaitlistEntry.id.in_(waitlist_entry_ids))
+                    .order_by(WaitlistEntry.id)
+                    .with_for_update()
+                )
+            }
+            evaluations = []
+            for completed_evaluation in completed_evaluations:
                 waitlist_entry_id = completed_evaluation['waitlist_entry_id']
-                waitlist_entry = session.query(WaitlistEntry).get(waitlist_entry_id)
+                waitlist_entry = waitlist_entries.get(waitlist_entry_id)
                 if waitlist_entry is None:
                     abort(404, f'Waitlist entry {waitlist_entry_id} not found')
-                evaluation = Evaluation(
-                    student_id=waitlist_entry.student_id,
-                    belt_id=waitlist_entry.belt_id,
-                    skill_domain_id=waitlist_entry.skill_domain_id,
-                    date=date_value,
-                    success=completed_evaluation['success'],
-                )
-                session.add(evaluation)
-                session.delete(waitlist_entry)  # type: ignore
+                evaluations.append({
+                    'student_id': waitlist_entry.student_id,
+                    'belt_id': waitlist_entry.belt_id,
+                    'skill_domain_id': waitlist_entry.skill_domain_id,
+                    'date': dates[completed_evaluation['date']],
+                    'success': completed_evaluation['success'],
+                })
+
+            session.execute(insert(Evaluation).values(evaluations))
+            (
+                session
+                .query(WaitlistEntry)
+                .filter(WaitlistEntry.id.in_(waitlist_entry_ids))
+                .delete(synchronize_session=False)
+            )
+            progress_to_refresh = [
+                (waitlist_entry.student_id, waitlist_entry.skill_domain_id)
+                for waitlist_entry in waitlist_entries.values()
+            ]
+            refresh_student_progress(session, progress_to_refresh)
             session.commit()
             return None, 204
 
@@ -1551,17 +2307,24 @@ class WaitlistConvertResource(Resource):
 class ExamsResource(Resource):
     @api.response(200, 'Success')
     def get(self, exam_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             exam = session.query(Exam).get(exam_id)
             if exam is None:
                 abort(404, f'Exam {exam_id} not found')
-            return send_file(
-                BytesIO(exam.file),
+            # from a path, send_file() supports Range and lets the server use
+            # sendfile(); the content hash makes a strong ETag
+            path = blob_store.path(exam.file_hash)
+            response = send_file(  # type: ignore
+                blob_store.open(exam.file_hash) if path is None else path,
+                mimetype='application/pdf',
                 as_attachment=True,
-                attachment_filename='exam.pdf',
+                download_name='exam.pdf',
+                etag=exam.file_hash,
             )
+            response.cache_control.private = True
+            return response
 
     put_model = api.model('ExamPut', {
         'code': fields.String(example='B'),
@@ -1573,7 +2336,7 @@ class ExamsResource(Resource):
     @api.expect(put_model, validate=True)
     @api.marshal_with(api_model_exam_one)
     def put(self, exam_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             exam = session.query(Exam).get(exam_id)
@@ -1603,18 +2366,22 @@ class ExamsResource(Resource):
                 exam.skill_domain_id = skill_domain_id
 
             session.commit()
+            forget_stamped_exams_of_exam(exam_id)
             return {
                 'exam': exam.json(),
             }
 
     @api.response(204, 'Success')
     def delete(self, exam_id: int) -> Any:
-        with session_context() as session:
+        with request_session_context() as session:
             me = authenticate(session)
             need_admin(me)
             exam = session.query(Exam).get(exam_id)
             if exam is None:
                 abort(404, f'Exam {exam_id} not found')
+            file_hash = exam.file_hash
             session.delete(exam)  # type: ignore
             session.commit()
+            delete_unused_blob(session, file_hash)
+            forget_stamped_exams_of_exam(exam_id)
             return None, 204
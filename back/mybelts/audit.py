@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from queue import Empty, Full, Queue
+from random import random
+from time import monotonic
+from typing import Any
+
+from mybelts.config import AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_QUEUE_SIZE, AUDIT_SAMPLE_RATE
+from mybelts.schema import HTTPRequest, engine
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """
+    Write HTTP requests to the database in the background
+
+    Records are put in a bounded queue, and a thread (a greenlet under gevent)
+    inserts them in batches. When the queue is full, records are dropped
+    rather than slowing down the responses.
+    """
+
+    def __init__(self, sample_rate: float, queue_size: int, batch_size: int, flush_interval: float) -> None:
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.reset()
+
+    def reset(self) -> None:
+        # in a new worker, after gevent patched threading; the queue and the
+        # lock are created again from the patched module, so that they block
+        # greenlets instead of the whole process
+        self.queue: Queue[dict[str, Any]] = Queue(maxsize=self.queue_size)
+        self.lock = threading.Lock()
+        self.pid: int | None = None
+        self.counters = {
+            'queued': 0,
+            'sampled_out': 0,
+            'dropped': 0,
+            'written': 0,
+            'failed': 0,
+        }
+
+    def record(self, row: dict[str, Any]) -> None:
+        if self.sample_rate < 1 and random() >= self.sample_rate:
+            self.count('sampled_out')
+            return
+        self.start()
+        try:
+            self.queue.put_nowait(row)
+        except Full:
+            self.count('dropped')
+        else:
+            self.count('queued')
+
+    def count(self, counter: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[counter] += n
+
+    def start(self) -> None:
+        # threads do not survive a fork, so start one in each worker; looked
+        # up when called, since gevent patches threading after the preload
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self) -> None:
+        while True:
+            rows = [self.queue.get()]
+            # wait a little for more rows, to insert them together
+            deadline = monotonic() + self.flush_interval
+            try:
+                while len(rows) < self.batch_size:
+                    rows.append(self.queue.get(timeout=max(0, deadline - monotonic())))
+            except Empty:
+                pass
+            try:
+                with engine.begin() as connection:
+                    # psycopg2 inserts the rows with a single statement
+                    connection.execute(HTTPRequest.__table__.insert(), rows)
+            except Exception:
+                logger.exception('Could not write %d HTTP requests', len(rows))
+                self.count('failed', len(rows))
+            else:
+                self.count('written', len(rows))
+            for _ in rows:
+                self.queue.task_done()
+
+    def flush(self) -> None:
+        # wait until the queued records are written
+        self.queue.join()
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            'pending': self.queue.qsize(),
+        }
+
+
+audit_writer = AuditWriter(
+    sample_rate=AUDIT_SAMPLE_RATE,
+    queue_size=AUDIT_QUEUE_SIZE,
+    batch_size=AUDIT_BATCH_SIZE,
+    flush_interval=AUDIT_FLUSH_INTERVAL,
+)
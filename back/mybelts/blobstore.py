@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import os
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from hashlib import sha256
+from typing import IO
+
+from mybelts.config import BLOB_STORE_DIR
+from mybelts.filestore import FileStore
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore(ABC):
+    """
+    Immutable blobs, addressed by the SHA-256 of their content
+
+    Storing the same content twice only keeps one copy.
+    """
+
+    @abstractmethod
+    def put(self, stream: IO[bytes]) -> str:
+        ...
+
+    @abstractmethod
+    def open(self, key: str) -> IO[bytes]:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool:
+        ...
+
+    def path(self, key: str) -> str | None:  # noqa: ARG002
+        # blobs with a local path can be sent by the server directly
+        return None
+
+    def get(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, directory: str) -> None:
+        self.files = FileStore(directory)
+
+    def path(self, key: str) -> str:
+        return self.files.path(key)
+
+    def put(self, stream: IO[bytes]) -> str:
+        # hash the content while copying it, without holding it in memory
+        h = sha256()
+        with self.files.temporary_file() as f:
+            while chunk := stream.read(CHUNK_SIZE):
+                h.update(chunk)
+                f.write(chunk)
+        key = h.hexdigest()
+        if key in self.files:
+            os.remove(f.name)
+        else:
+            self.files.put_file(key, f.name)
+        return key
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.files
+
+    def open(self, key: str) -> IO[bytes]:
+        return open(self.path(key), 'rb')  # noqa: SIM115
+
+    def delete(self, key: str) -> None:
+        with suppress(FileNotFoundError):
+            os.remove(self.path(key))
+
+
+blob_store = LocalBlobStore(BLOB_STORE_DIR)
@@ -1,4 +1,5 @@
 from os import environ
+from os.path import expanduser, join
 
 PGUSER = environ.get('PGUSER', 'mybelts')
 PGPASSWORD = environ.get('PGPASSWORD', 'mybelts')
@@ -8,4 +9,80 @@ PGSCHEMA = environ.get('PGSCHEMA', 'mybelts')
 
 POSTGRES_URI = f'postgresql+psycopg2://{PGUSER}:{PGPASSWORD}@{PGHOST}:{PGPORT}/{PGSCHEMA}'
 
+# processes serving the requests, set by gunicorn.conf.py
+WEB_CONCURRENCY = int(environ.get('WEB_CONCURRENCY', 1))
+# connections to the primary, by all the processes together; keep it under its
+# max_connections (100 by default), with room for manage and psql
+DB_MAX_CONNECTIONS = int(environ.get('DB_MAX_CONNECTIONS', 90))
+# each process has a read-write and a read-only pool on the primary
+DB_POOLS = 2
+DB_POOL_CONNECTIONS = max(1, DB_MAX_CONNECTIONS // (WEB_CONCURRENCY * DB_POOLS))  # share of each pool
+
+# connections to the database, in each pool; by default, within DB_MAX_CONNECTIONS
+DB_POOL_SIZE = int(environ.get('DB_POOL_SIZE', min(5, DB_POOL_CONNECTIONS)))
+DB_POOL_MAX_OVERFLOW = int(environ.get(  # connections beyond DB_POOL_SIZE
+    'DB_POOL_MAX_OVERFLOW',
+    min(10, max(0, DB_POOL_CONNECTIONS - DB_POOL_SIZE)),
+))
+DB_POOL_TIMEOUT = float(environ.get('DB_POOL_TIMEOUT', 30))  # seconds waiting for a connection
+DB_POOL_RECYCLE = int(environ.get('DB_POOL_RECYCLE', 3600))  # seconds; -1 to keep connections forever
+DB_POOL_PRE_PING = environ.get('DB_POOL_PRE_PING', '1') == '1'  # check connections before using them
+
+# optional streaming replica of the database, read by the GET requests; its
+# pool has the same settings
+REPLICA_PGHOST = environ.get('REPLICA_PGHOST')
+REPLICA_PGPORT = environ.get('REPLICA_PGPORT', PGPORT)
+REPLICA_POSTGRES_URI = (
+    None if REPLICA_PGHOST is None
+    else f'postgresql+psycopg2://{PGUSER}:{PGPASSWORD}@{REPLICA_PGHOST}:{REPLICA_PGPORT}/{PGSCHEMA}'
+)
+REPLICA_MAX_LAG = float(environ.get('REPLICA_MAX_LAG', 5))  # seconds; the primary is read when the replica is later
+REPLICA_LAG_CHECK_INTERVAL = float(environ.get('REPLICA_LAG_CHECK_INTERVAL', 1))  # seconds
+REPLICA_TIMEOUT = int(environ.get('REPLICA_TIMEOUT', 2))  # seconds connecting to the replica or checking its lag
+REPLICA_STICKINESS = int(environ.get('REPLICA_STICKINESS', 10))  # seconds reading the primary after writing
+
 SECRET = 'some_secret'
+
+# log the HTTP requests to the database (always on in debug mode)
+AUDIT_HTTP_REQUESTS = environ.get('AUDIT_HTTP_REQUESTS', '') == '1'
+AUDIT_SAMPLE_RATE = float(environ.get('AUDIT_SAMPLE_RATE', 1.0))  # fraction of the requests
+AUDIT_QUEUE_SIZE = int(environ.get('AUDIT_QUEUE_SIZE', 10000))  # requests; more are dropped
+AUDIT_BATCH_SIZE = int(environ.get('AUDIT_BATCH_SIZE', 100))  # requests per INSERT
+AUDIT_FLUSH_INTERVAL = float(environ.get('AUDIT_FLUSH_INTERVAL', 1.0))  # seconds
+
+# authenticated users are looked up again after this long
+PRINCIPAL_CACHE_TTL = float(environ.get('PRINCIPAL_CACHE_TTL', 30))  # seconds
+PRINCIPAL_CACHE_SIZE = int(environ.get('PRINCIPAL_CACHE_SIZE', 10000))  # tokens
+
+# cost of the password hashes; hashes with other rounds are updated on login
+PASSWORD_ROUNDS = int(environ.get('PASSWORD_ROUNDS', 25000))
+# threads hashing the passwords, outside of the event loop
+PASSWORD_THREADS = int(environ.get('PASSWORD_THREADS', 4))
+PASSWORD_QUEUE_SIZE = int(environ.get('PASSWORD_QUEUE_SIZE', 64))  # hashes; more are refused
+
+# the events of missing i18n keys are deleted after this long; their counts are kept
+MISSING_I18N_KEY_RETENTION = int(environ.get('MISSING_I18N_KEY_RETENTION', 90))  # days
+MISSING_I18N_KEY_BATCH_SIZE = int(environ.get('MISSING_I18N_KEY_BATCH_SIZE', 100))  # events per request
+
+# requests issuing more SQL statements are logged
+SQL_STATEMENT_BUDGET = int(environ.get('SQL_STATEMENT_BUDGET', 20))
+
+# 'pypdf' composes the exams in-process, holding the whole document in memory;
+# 'pdftk' uses pdftk and pdfjam, through files
+PDF_BACKEND = environ.get('PDF_BACKEND', 'pypdf')
+# threads rendering the name-stamps and preparing the exams of one document
+PRINT_THREADS = int(environ.get('PRINT_THREADS', 4))
+
+# uploaded files, addressed by their content
+BLOB_STORE_DIR = environ.get('BLOB_STORE_DIR', join(expanduser('~'), '.local', 'share', 'mybelts', 'blobs'))
+
+# persistent caches, shared by all the workers
+CACHE_DIR = environ.get('CACHE_DIR', join(expanduser('~'), '.cache', 'mybelts'))
+STAMP_CACHE_MAX_SIZE = int(environ.get('STAMP_CACHE_MAX_SIZE', 64 * 1024 * 1024))  # bytes
+STAMPED_EXAM_CACHE_MAX_SIZE = int(environ.get('STAMPED_EXAM_CACHE_MAX_SIZE', 512 * 1024 * 1024))  # bytes
+PRINT_RESULTS_MAX_SIZE = int(environ.get('PRINT_RESULTS_MAX_SIZE', 256 * 1024 * 1024))  # bytes
+
+# background generation of the exams
+PRINT_WORKERS = int(environ.get('PRINT_WORKERS', 2))
+PRINT_QUEUE_SIZE = int(environ.get('PRINT_QUEUE_SIZE', 8))
+PRINT_JOB_TIMEOUT = int(environ.get('PRINT_JOB_TIMEOUT', 600))  # seconds
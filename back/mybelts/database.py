@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import logging
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Iterator
+
+from gevent import Timeout  # type: ignore
+from gevent.monkey import is_module_patched  # type: ignore
+from gevent.socket import wait_read, wait_write  # type: ignore
+from psycopg2 import OperationalError, extensions  # type: ignore
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from mybelts.config import (
+    DB_POOL_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    POSTGRES_URI,
+)
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_LSN_QUERY = text('SELECT pg_current_wal_lsn()')
+
+# 0 when the replica replayed everything written on the primary until now,
+# else the seconds since the last transaction replayed; this also catches a
+# replica that stopped receiving; a server that is not a replica is never late
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn) THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class PoolStats:
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0  # seconds
+        self.max_wait_time = 0.0  # seconds
+        self.max_overflow = 0
+
+    def record(self, wait_time: float, overflow: int, timed_out: bool) -> None:
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            self.max_overflow = max(self.max_overflow, overflow)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long the connections were waited for
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self) -> Any:
+        start = perf_counter()
+        try:
+            connection = super()._do_get()  # type: ignore
+        except PoolTimeoutError:
+            self.stats.record(perf_counter() - start, self.overflow_connections(), timed_out=True)
+            raise
+        self.stats.record(perf_counter() - start, self.overflow_connections(), timed_out=False)
+        return connection
+
+    def overflow_connections(self) -> int:
+        # overflow() starts at minus the size of the pool
+        overflow: int = self.overflow()  # type: ignore
+        return max(0, overflow)
+
+
+def gevent_wait_callback(connection: Any, timeout: float | None = None) -> None:
+    # wait for the database in the event loop, instead of blocking it
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            break
+        if state == extensions.POLL_READ:
+            wait_read(connection.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(connection.fileno(), timeout=timeout)
+        else:
+            message = f'Bad result from poll: {state!r}'
+            raise OperationalError(message)
+
+
+def make_psycopg2_cooperative() -> None:
+    # only useful once gevent patched the standard library, as in its workers
+    if is_module_patched('socket'):
+        extensions.set_wait_callback(gevent_wait_callback)
+
+
+@contextmanager
+def time_limit(seconds: float) -> Iterator[None]:
+    """
+    Raise TimeoutError when the block takes longer
+
+    Under gevent, libpq ignores connect_timeout, since psycopg2 connects
+    without blocking; otherwise, this relies on the timeouts of the engine.
+    """
+    if not is_module_patched('socket'):
+        yield
+        return
+    with Timeout(seconds, TimeoutError):
+        yield
+
+
+def create_database_engine(
+    uri: str = POSTGRES_URI,
+    read_only: bool = False,
+    connect_timeout: int | None = None,
+) -> Engine:
+    """
+    Create an engine with the configured pool
+
+    With read_only, the connections refuse to write, and each statement runs
+    on its own, without BEGIN and COMMIT round-trips. This does not change
+    what the statements see, since each of them takes a new snapshot in READ
+    COMMITTED anyway.
+    """
+    make_psycopg2_cooperative()
+    connect_args: dict[str, Any] = {}
+    options: dict[str, Any] = {}
+    if read_only:
+        connect_args['options'] = '-c default_transaction_read_only=on'
+        options['isolation_level'] = 'AUTOCOMMIT'
+    if connect_timeout is not None:
+        connect_args['connect_timeout'] = connect_timeout
+    return create_engine(
+        uri,
+        **options,
+        connect_args=connect_args,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+def measure_replica_lag(engine: Engine, primary_engine: Engine, timeout: float) -> float | None:
+    # None when unknown, such as when the replica cannot be reached
+    try:
+        with time_limit(timeout):
+            with primary_engine.connect() as connection:
+                primary_lsn = connection.execute(PRIMARY_LSN_QUERY).scalar()
+            with engine.connect() as connection:
+                lag = connection.execute(REPLICA_LAG_QUERY, {'primary_lsn': primary_lsn}).scalar()
+    except (SQLAlchemyError, TimeoutError) as e:
+        # once per check, so keep it short
+        logger.warning('Could not measure the lag of the replica: %s', e.__class__.__name__)
+        return None
+    return None if lag is None else float(lag)
+
+
+def connect_session(session: Session, timeout: float) -> bool:
+    # check out the connection of the session now, to know whether it works
+    try:
+        with time_limit(timeout):
+            session.connection()
+    except (SQLAlchemyError, TimeoutError) as e:
+        logger.warning('Could not connect to the replica: %s', e.__class__.__name__)
+        return False
+    return True
+
+
+def pool_stats(engine: Engine) -> dict[str, Any]:
+    # of this process
+    pool = engine.pool
+    assert isinstance(pool, InstrumentedQueuePool)
+    stats = pool.stats
+    with stats.lock:
+        return {
+            'size': pool.size(),  # type: ignore
+            'checked_out': pool.checkedout(),  # type: ignore
+            'overflow': pool.overflow_connections(),
+            'max_overflow': stats.max_overflow,
+            'checkouts': stats.checkouts,
+            'timeouts': stats.timeouts,
+            'wait_time': stats.wait_time,
+            'max_wait_time': stats.max_wait_time,
+        }
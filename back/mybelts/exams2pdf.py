@@ -1,19 +1,38 @@
 from __future__ import annotations
 
-from functools import lru_cache
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from hashlib import sha256
+from io import BytesIO
 from itertools import zip_longest
-from os import remove
+from os import listdir, remove
+from os.path import isdir, join
 from subprocess import CalledProcessError, check_output, run
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from threading import Thread
+from time import perf_counter
 from typing import TYPE_CHECKING, TypedDict
 
-from sqlalchemy import func
+from pypdf import PdfReader, PdfWriter, Transformation
+from sqlalchemy import and_, func, tuple_
 
-from mybelts.schema import Evaluation, Exam, WaitlistEntry
+from mybelts.blobstore import blob_store
+from mybelts.config import CACHE_DIR, PDF_BACKEND, PRINT_THREADS, STAMP_CACHE_MAX_SIZE, STAMPED_EXAM_CACHE_MAX_SIZE
+from mybelts.filestore import FileStore
+from mybelts.schema import Evaluation, Exam, Student, WaitlistEntry
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
     from sqlalchemy.orm import scoped_session
 
+logger = logging.getLogger(__name__)
+
+# in PostScript points
+A4_WIDTH = 595.276
+A4_HEIGHT = 841.89
+
 stamp_template = """\
 <?xml version="1.0" encoding="UTF-8"?>
 <svg width="210mm" height="297mm" viewBox="0 0 210 297" font-size="6px" text-anchor="middle">
@@ -23,57 +42,128 @@ stamp_template = """\
 """
 
 
-@lru_cache
+stamp_store = FileStore(join(CACHE_DIR, 'stamps'), max_size=STAMP_CACHE_MAX_SIZE)
+
+
 def stamp_of_student(display_name: str, full_class_name: str) -> bytes:
     stamp_svg = stamp_template.format(display_name=display_name, full_class_name=full_class_name).encode()
+    key = sha256(stamp_svg).hexdigest()
+    stamp_pdf = stamp_store.get(key)
+    if stamp_pdf is not None:
+        return stamp_pdf
     command = ['inkscape', '/dev/stdin', '--export-type=pdf', '--export-filename=-']
     res = run(command, input=stamp_svg, capture_output=True, check=False)
     stamp_pdf = res.stdout
     if not stamp_pdf:
         print(res.stderr.decode())
         raise CalledProcessError(0, command)
+    stamp_store.put(key, stamp_pdf)
     return stamp_pdf
 
 
+def warm_stamp(display_name: str, full_class_name: str) -> None:
+    try:
+        stamp_of_student(display_name, full_class_name)
+    except (OSError, CalledProcessError):
+        logger.warning('Could not pre-render stamp of %s (%s)', display_name, full_class_name)
+
+
+def warm_stamp_of_student(display_name: str, full_class_name: str) -> None:
+    # render the stamp in the background, so that it is ready at print time
+    Thread(target=warm_stamp, args=(display_name, full_class_name), daemon=True).start()
+
+
+def warm_stamps_of_students(display_names: list[str], full_class_name: str) -> None:
+    # one at a time, to leave the CPU to the requests
+    def warm() -> None:
+        for display_name in display_names:
+            warm_stamp(display_name, full_class_name)
+    Thread(target=warm, daemon=True).start()
+
+
+# exams stamped with the name of a student, in a directory per exam
+stamped_exam_dir = join(CACHE_DIR, 'stamped-exams')
+
+
+def stamped_exam_store(exam_id: int) -> FileStore:
+    return FileStore(join(stamped_exam_dir, str(exam_id)))
+
+
+def student_key(display_name: str, full_class_name: str) -> str:
+    return sha256(f'{display_name}\0{full_class_name}'.encode()).hexdigest()
+
+
+def stamped_exam_key(content_hash: str, display_name: str, full_class_name: str) -> str:
+    # the student comes first, so that their exams can be found by prefix
+    return student_key(display_name, full_class_name) + content_hash
+
+
+def forget_stamped_exams_of_exam(exam_id: int) -> None:
+    stamped_exam_store(exam_id).clear()
+
+
+def forget_stamped_exams_of_student(display_name: str, full_class_name: str) -> None:
+    if not isdir(stamped_exam_dir):
+        return
+    key = student_key(display_name, full_class_name)
+    for directory in listdir(stamped_exam_dir):
+        FileStore(join(stamped_exam_dir, directory)).remove_prefix(key)
+
+
 class Entry(TypedDict):
     student_id: int
     skill_domain_id: int
     belt_id: int
 
 
-def exams_to_print(
+def select_exams(
     session: scoped_session,
     waitlist_entry_ids: list[int],
 ) -> tuple[list[tuple[Exam, str]], list[str]]:
-    # TODO: use single SQL query
-    exams_with_names = []
-    errors = []
-    for waitlist_entry_id in waitlist_entry_ids:
-        waitlist_entry = (
-            session
-            .query(WaitlistEntry)
-            .get(waitlist_entry_id)
-        )
-        if waitlist_entry is None:
-            continue
-        student = waitlist_entry.student
-        attempt_number = (
-            session
-            .query(Evaluation)
-            .filter(Evaluation.student_id == waitlist_entry.student_id)
-            .filter(Evaluation.skill_domain_id == waitlist_entry.skill_domain_id)
-            .filter(Evaluation.belt_id == waitlist_entry.belt_id)
-            .count()
-        )
+    # fetch the waitlist entries with the name of the student and the number
+    # of previous attempts at the corresponding belt
+    rows = (
+        session  # type: ignore
+        .query(WaitlistEntry, Student.display_name, func.count(Evaluation.id))
+        .join(Student, Student.id == WaitlistEntry.student_id)
+        .outerjoin(Evaluation, and_(
+            Evaluation.student_id == WaitlistEntry.student_id,
+            Evaluation.skill_domain_id == WaitlistEntry.skill_domain_id,
+            Evaluation.belt_id == WaitlistEntry.belt_id,
+        ))
+        .filter(WaitlistEntry.id.in_(waitlist_entry_ids))
+        .group_by(WaitlistEntry.id, Student.id)
+        .all()
+    )
+    entries = {
+        waitlist_entry.id: (waitlist_entry, display_name, attempt_number)
+        for waitlist_entry, display_name, attempt_number in rows
+    }
+
+    # fetch all the candidate exams at once
+    exams_of_pair: dict[tuple[int, int], list[Exam]] = {}
+    pairs = list({(waitlist_entry.skill_domain_id, waitlist_entry.belt_id) for waitlist_entry, _, _ in rows})
+    if pairs:
         exams = (
             session
             .query(Exam)
             # TODO: filter by level id
-            .filter(Exam.skill_domain_id == waitlist_entry.skill_domain_id)
-            .filter(Exam.belt_id == waitlist_entry.belt_id)
+            .filter(tuple_(Exam.skill_domain_id, Exam.belt_id).in_(pairs))
             .order_by(Exam.code)
             .all()
         )
+        for exam in exams:
+            exams_of_pair.setdefault((exam.skill_domain_id, exam.belt_id), []).append(exam)
+
+    # pick the exams in the order of the request
+    exams_with_names = []
+    errors = []
+    for waitlist_entry_id in waitlist_entry_ids:
+        entry = entries.get(waitlist_entry_id)
+        if entry is None:
+            continue
+        waitlist_entry, display_name, attempt_number = entry
+        exams = exams_of_pair.get((waitlist_entry.skill_domain_id, waitlist_entry.belt_id), [])
         if not exams:
             errors.append(
                 f'No exam for skill_domain {waitlist_entry.skill_domain_id} '
@@ -81,7 +171,15 @@ def exams_to_print(
             )
             continue
         exam = exams[attempt_number % len(exams)]
-        exams_with_names.append((exam, student.display_name))
+        exams_with_names.append((exam, display_name))
+    return exams_with_names, errors
+
+
+def exams_to_print(
+    session: scoped_session,
+    waitlist_entry_ids: list[int],
+) -> tuple[list[tuple[Exam, str]], list[str]]:
+    exams_with_names, errors = select_exams(session, waitlist_entry_ids)
     (
         session
         .query(WaitlistEntry)
@@ -92,11 +190,31 @@ def exams_to_print(
     return exams_with_names, errors
 
 
-def print_exams_as_pdf(full_class_name: str, exams_with_names: list[tuple[Exam, str]], path: str) -> None:
+@contextmanager
+def timed(timings: dict[str, float], stage: str) -> Iterator[None]:
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + perf_counter() - start
+
+
+def print_exams_as_pdf(
+    full_class_name: str,
+    exams_with_names: list[tuple[Exam, str]],
+    path: str,
+    backend: str = PDF_BACKEND,
+) -> dict[str, float]:
+    """
+    Write the exams, stamped with the names of the students, two per sheet
+
+    Return the time spent in each stage (cache, stamp, multistamp,
+    concatenation and nup), in seconds.
+    """
 
     # put first half on the left, second half on the right
     # e.g. 0, 5, 1, 6, 2, 7, 3, 8, 4, 9
-    # pdfjam will then group them by two
+    # pages will then be grouped by two
     # e.g. 05 16 27 38 49
     # they will then be stacked and the stack cut in two
     # e.g. 05    0   5
@@ -113,36 +231,144 @@ def print_exams_as_pdf(full_class_name: str, exams_with_names: list[tuple[Exam,
         if element is not None
     ]
 
+    if backend == 'pypdf':
+        stamp_exam, impose = stamp_exam_with_pypdf, impose_with_pypdf
+    elif backend == 'pdftk':
+        stamp_exam, impose = stamp_exam_with_pdftk, impose_with_pdftk
+    else:
+        msg = f'Unknown PDF backend {backend}'
+        raise ValueError(msg)
+
+    timings: dict[str, float] = {}
+
+    def cached_piece(i: int) -> bytes | None:
+        exam, _ = exams_with_names[i]
+        return stamped_exam_store(exam.id).get(keys[i])
+
+    def stamp_piece(i: int, stamp: bytes) -> bytes:
+        exam, _ = exams_with_names[i]
+        piece = stamp_exam(blob_store.get(exam.file_hash), stamp)
+        # the exam might have been changed meanwhile
+        with suppress(FileNotFoundError):
+            stamped_exam_store(exam.id).put(keys[i], piece)
+        return piece
+
+    # stamps are rendered by Inkscape and files read from and written to disk,
+    # so threads overlap well; map() keeps the pages in order
+    with ThreadPoolExecutor(max_workers=PRINT_THREADS) as executor:
+        # reuse the exams already stamped for these students
+        with timed(timings, 'cache'):
+            keys = [
+                stamped_exam_key(exam.file_hash, display_name, full_class_name)
+                for exam, display_name in exams_with_names
+            ]
+            cached_pieces = list(executor.map(cached_piece, range(len(exams_with_names))))
+        misses = [i for i, piece in enumerate(cached_pieces) if piece is None]
+
+        with timed(timings, 'stamp'):
+            stamps = list(executor.map(
+                stamp_of_student,
+                [exams_with_names[i][1] for i in misses],
+                [full_class_name] * len(misses),
+            ))
+
+        with timed(timings, 'multistamp'):
+            stamped_pieces = dict(zip(misses, executor.map(stamp_piece, misses, stamps)))
+    if misses:
+        FileStore(stamped_exam_dir).evict(STAMPED_EXAM_CACHE_MAX_SIZE)
+
+    pieces = [
+        stamped_pieces[i] if piece is None else piece
+        for i, piece in enumerate(cached_pieces)
+    ]
+    impose(pieces, path, timings)
+
+    logger.info(
+        'Printed %d exams with %s (%d already stamped): %s',
+        len(exams_with_names),
+        backend,
+        len(exams_with_names) - len(misses),
+        ', '.join(f'{stage} {duration:.3f} s' for stage, duration in timings.items()),
+    )
+    return timings
+
+
+def stamp_exam_with_pypdf(exam_file: bytes, stamp: bytes) -> bytes:
+    # stamp the first page of the exam
+    writer = PdfWriter(clone_from=PdfReader(BytesIO(exam_file)))
+    writer.pages[0].merge_page(PdfReader(BytesIO(stamp)).pages[0])
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def impose_with_pypdf(pieces: list[bytes], path: str, timings: dict[str, float]) -> None:
+    # pypdf only writes the document at the end, and the sheets refer to the
+    # objects of the pieces, so every piece and the whole document stay in
+    # memory until then; the pdftk backend goes through files instead
+    with timed(timings, 'concatenation'):
+        pages = [page for piece in pieces for page in PdfReader(BytesIO(piece)).pages]
+
+    # group two pages by landscape sheet, like pdfjam --nup 2x1 --landscape
+    with timed(timings, 'nup'):
+        writer = PdfWriter()
+        sheet_width, sheet_height = A4_HEIGHT, A4_WIDTH
+        cell_width = sheet_width / 2
+        for left, right in zip_longest(pages[::2], pages[1::2]):
+            sheet = writer.add_blank_page(sheet_width, sheet_height)
+            for x, page in ((0, left), (cell_width, right)):
+                if page is None:
+                    continue
+                page.transfer_rotation_to_content()
+                box = page.cropbox
+                width, height = float(box.width), float(box.height)
+                # fit the page in its half of the sheet, centered
+                scale = min(cell_width / width, sheet_height / height)
+                transformation = (
+                    Transformation()
+                    .translate(-float(box.left), -float(box.bottom))
+                    .scale(scale)
+                    .translate(x + (cell_width - width * scale) / 2, (sheet_height - height * scale) / 2)
+                )
+                sheet.merge_transformed_page(page, transformation)
+        writer.write(path)
+
+
+def stamp_exam_with_pdftk(exam_file: bytes, stamp: bytes) -> bytes:
+    with TemporaryDirectory() as directory:
+        exam, stamp_file = join(directory, 'exam.pdf'), join(directory, 'stamp.pdf')
+        first_page, stamped_page = join(directory, 'first.pdf'), join(directory, 'stamped.pdf')
+        with open(exam, 'wb') as f:
+            f.write(exam_file)
+        with open(stamp_file, 'wb') as f:
+            f.write(stamp)
+        # stamp and multistamp stamp every page, so stamp the first page on its
+        # own, as with pypdf
+        check_output(['pdftk', exam, 'cat', '1', 'output', first_page])
+        check_output(['pdftk', first_page, 'stamp', stamp_file, 'output', stamped_page])
+        if len(PdfReader(BytesIO(exam_file)).pages) == 1:
+            with open(stamped_page, 'rb') as f:
+                return f.read()
+        return check_output(['pdftk', f'A={stamped_page}', f'B={exam}', 'cat', 'A', 'B2-end', 'output', '-'])
+
+
+def impose_with_pdftk(pieces: list[bytes], path: str, timings: dict[str, float]) -> None:
+    files: list[str] = []
     try:
-        # prepare all the exams and name-stamps
-        exam_files = []
-        stamp_files = []
-        for exam, display_name in exams_with_names:
-            stamp = stamp_of_student(display_name, full_class_name)
-            stamp_file = NamedTemporaryFile(suffix='.pdf', delete=False)
-            stamp_files.append(stamp_file.name)
-            stamp_file.write(stamp)
-
-            exam_file = NamedTemporaryFile(suffix='.pdf', delete=False)
-            exam_files.append(exam_file.name)
-            exam_file.write(exam.file)
-
-        with (
-            NamedTemporaryFile(suffix='.pdf') as all_stamps,
-            NamedTemporaryFile(suffix='.pdf') as all_exams,
-            NamedTemporaryFile(suffix='.pdf') as stamped_exams,
-        ):
-            # concatenate all the name-stamps
-            check_output(['pdftk', *stamp_files, 'cat', 'output', all_stamps.name])
-
-            # concatenate all the exams
-            check_output(['pdftk', *exam_files, 'cat', 'output', all_exams.name])
-
-            # stamp everything
-            check_output(['pdftk', all_exams.name, 'multistamp', all_stamps.name, 'output', stamped_exams.name])
+        with NamedTemporaryFile(suffix='.pdf') as stamped_exams:
+            # concatenate all the stamped exams
+            with timed(timings, 'concatenation'):
+                for piece in pieces:
+                    with NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+                        files.append(f.name)
+                        f.write(piece)
+                check_output(['pdftk', *files, 'cat', 'output', stamped_exams.name])
 
             # group two pages by sheet
-            check_output(['pdfjam', '--quiet', stamped_exams.name, '--nup', '2x1', '--landscape', '--outfile', path])
+            with timed(timings, 'nup'):
+                check_output([
+                    'pdfjam', '--quiet', stamped_exams.name, '--nup', '2x1', '--landscape', '--outfile', path,
+                ])
     finally:
-        for file in stamp_files + exam_files:
+        for file in files:
             remove(file)
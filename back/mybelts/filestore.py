@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+import shutil
+from contextlib import suppress
+from glob import escape, glob
+from os.path import dirname, join
+from tempfile import NamedTemporaryFile
+from typing import IO
+
+
+class FileStore:
+    """
+    Files stored on the local filesystem under content-derived keys
+
+    Files are written atomically, so a store can be shared by several
+    processes. When max_size is set, the least recently used files are evicted
+    whenever the total size of the store goes over it. The total size is
+    counted from the files written by this process since the last scan of the
+    store, so the files written by other processes are only seen by the next
+    scan.
+    """
+
+    def __init__(self, directory: str, max_size: int | None = None) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # None until the store is scanned
+        self.size: int | None = None
+
+    def path(self, key: str) -> str:
+        return join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> bytes | None:
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # mark as recently used
+        with suppress(OSError):
+            os.utime(path)
+        return data
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put(self, key: str, data: bytes) -> None:
+        with self.temporary_file() as f:
+            f.write(data)
+        self.put_file(key, f.name)
+
+    def remove_prefix(self, prefix: str) -> None:
+        # prefix must be at least two characters long
+        for path in glob(escape(self.path(prefix)) + '*'):
+            with suppress(FileNotFoundError):
+                os.remove(path)
+        self.size = None
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.size = None
+
+    def temporary_file(self) -> IO[bytes]:
+        # hidden temporary files are never evicted
+        os.makedirs(self.directory, exist_ok=True)
+        return NamedTemporaryFile(dir=self.directory, prefix='.', delete=False)
+
+    def put_file(self, key: str, path: str) -> None:
+        # move a file from temporary_file() into the store
+        target = self.path(key)
+        os.makedirs(dirname(target), exist_ok=True)
+        size = os.stat(path).st_size
+        with suppress(FileNotFoundError):
+            size -= os.stat(target).st_size
+        os.replace(path, target)
+        if self.max_size is None:
+            return
+        if self.size is not None:
+            self.size += size
+        # only scan the store when it may be over the limit
+        if self.size is None or self.size > self.max_size:
+            self.evict(self.max_size)
+
+    def evict(self, max_size: int) -> None:
+        files = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # evicted by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in files)
+        files.sort()
+        for _, size, path in files:
+            if total_size <= max_size:
+                break
+            with suppress(FileNotFoundError):
+                os.remove(path)
+            total_size -= size
+        self.size = total_size
+
+    def stats(self) -> dict[str, int | None]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': self.size,
+        }
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import func
+
+from mybelts.config import MISSING_I18N_KEY_RETENTION
+from mybelts.schema import MissingI18nKey, MissingI18nKeyCount
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+PURGE_BATCH_SIZE = 10000  # events per DELETE
+
+
+def record_missing_i18n_keys(session: Session, events: list[dict[str, str]]) -> None:
+    """
+    Store the events of missing i18n keys and count them by key
+
+    The events are dicts with language, namespace and key.
+    """
+    if not events:
+        return
+    session.execute(insert(MissingI18nKey).values([
+        {
+            'language': event['language'],
+            'namespace': event['namespace'],
+            'key': event['key'],
+        }
+        for event in events
+    ]))
+    counts: dict[tuple[str, str, str], int] = {}
+    for event in events:
+        key = (event['language'], event['namespace'], event['key'])
+        counts[key] = counts.get(key, 0) + 1
+    # in a fixed order, so that concurrent batches do not deadlock
+    statement = insert(MissingI18nKeyCount).values([
+        {
+            'language': language,
+            'namespace': namespace,
+            'key': key,
+            'count': count,
+            'first_seen': func.now(),
+            'last_seen': func.now(),
+        }
+        for (language, namespace, key), count in sorted(counts.items())
+    ])
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[MissingI18nKeyCount.language, MissingI18nKeyCount.namespace, MissingI18nKeyCount.key],
+        set_={
+            'count': MissingI18nKeyCount.count + statement.excluded.count,
+            'last_seen': statement.excluded.last_seen,
+        },
+    ))
+
+
+def purge_missing_i18n_keys(session: Session, retention: int = MISSING_I18N_KEY_RETENTION) -> int:
+    """
+    Delete the events older than the retention, in days; the counts are kept
+
+    Commit after each batch, to avoid holding locks for long. Return the
+    number of events deleted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention)
+    deleted = 0
+    while True:
+        batch = select(MissingI18nKey.id).where(MissingI18nKey.created < cutoff).limit(PURGE_BATCH_SIZE)  # type: ignore
+        count: int = (
+            session
+            .query(MissingI18nKey)
+            .filter(MissingI18nKey.id.in_(batch))
+            .delete(synchronize_session=False)
+        )
+        session.commit()
+        deleted += count
+        if count < PURGE_BATCH_SIZE:
+            return deleted
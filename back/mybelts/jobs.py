@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import suppress
+from hashlib import sha256
+from multiprocessing import get_context
+from os import remove, stat
+from os.path import join
+from time import time
+from typing import TypedDict
+
+from mybelts.config import CACHE_DIR, PRINT_JOB_TIMEOUT, PRINT_QUEUE_SIZE, PRINT_RESULTS_MAX_SIZE, PRINT_WORKERS
+from mybelts.exams2pdf import print_exams_as_pdf
+from mybelts.filestore import FileStore
+from mybelts.schema import Exam
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job(TypedDict):
+    id: str
+    status: str  # 'pending', 'done' or 'failed'
+    error: str | None
+    timings: dict[str, float] | None
+
+
+# the state of the jobs is kept on disk, so that any worker can report it:
+# - <job_id> is the generated document, in result_store
+# - <job_id>.pending exists while the job runs, in job_store
+# - <job_id>.failed contains the error message, in job_store
+# - <job_id>.timings contains the time spent in each stage, as JSON, in job_store
+# the small state files are never evicted, unlike the documents
+result_store = FileStore(join(CACHE_DIR, 'exam-pdfs'), max_size=PRINT_RESULTS_MAX_SIZE)
+job_store = FileStore(join(CACHE_DIR, 'exam-pdf-jobs'))
+
+# jobs started by this worker
+futures: dict[str, Future[None]] = {}
+executor: ProcessPoolExecutor | None = None
+
+
+def job_id_of(full_class_name: str, exams_with_names: list[tuple[Exam, str]]) -> str:
+    # submitting the same exams for the same students yields the same job
+    h = sha256(full_class_name.encode())
+    for exam, display_name in exams_with_names:
+        h.update(f'\0{exam.id}\0{exam.file_hash}\0{display_name}'.encode())
+    return h.hexdigest()
+
+
+def run_print_job(job_id: str, full_class_name: str, exams_with_names: list[tuple[int, str, str]]) -> None:
+    # in a process of the pool
+    with result_store.temporary_file() as f:
+        path = f.name
+    try:
+        timings = print_exams_as_pdf(
+            full_class_name,
+            [
+                (Exam(id=exam_id, file_hash=file_hash), display_name)
+                for exam_id, file_hash, display_name in exams_with_names
+            ],
+            path,
+        )
+    except Exception as e:
+        remove(path)
+        job_store.put(job_id + '.failed', (str(e) or type(e).__name__).encode())
+        raise
+    else:
+        job_store.put(job_id + '.timings', json.dumps(timings).encode())
+        result_store.put_file(job_id, path)
+    finally:
+        with suppress(FileNotFoundError):
+            remove(job_store.path(job_id + '.pending'))
+
+
+def submit_print_job(full_class_name: str, exams_with_names: list[tuple[Exam, str]]) -> Job:
+    global executor  # noqa: PLW0603
+
+    job_id = job_id_of(full_class_name, exams_with_names)
+    job = get_job(job_id)
+    if job is not None and job['status'] != 'failed':
+        return job
+
+    if sum(not future.done() for future in futures.values()) >= PRINT_QUEUE_SIZE:
+        raise QueueFullError
+    if executor is None:
+        # do not fork the event loop of the worker
+        executor = ProcessPoolExecutor(max_workers=PRINT_WORKERS, mp_context=get_context('spawn'))
+    with suppress(FileNotFoundError):
+        remove(job_store.path(job_id + '.failed'))
+    job_store.put(job_id + '.pending', b'')
+    futures[job_id] = executor.submit(
+        run_print_job,
+        job_id,
+        full_class_name,
+        [(exam.id, exam.file_hash, display_name) for exam, display_name in exams_with_names],
+    )
+    return {'id': job_id, 'status': 'pending', 'error': None, 'timings': None}
+
+
+def get_job(job_id: str) -> Job | None:
+    # forget about the jobs of this worker that are over
+    for other_job_id, future in list(futures.items()):
+        if future.done():
+            del futures[other_job_id]
+
+    if job_id in result_store:
+        timings = job_store.get(job_id + '.timings')
+        return {
+            'id': job_id,
+            'status': 'done',
+            'error': None,
+            'timings': None if timings is None else json.loads(timings),
+        }
+    error = job_store.get(job_id + '.failed')
+    if error is not None:
+        return {'id': job_id, 'status': 'failed', 'error': error.decode(), 'timings': None}
+    try:
+        started = stat(job_store.path(job_id + '.pending')).st_mtime
+    except FileNotFoundError:
+        # unknown, or its document was evicted
+        return None
+    if time() - started > PRINT_JOB_TIMEOUT:
+        # the process running the job died
+        return {'id': job_id, 'status': 'failed', 'error': 'Timed out', 'timings': None}
+    return {'id': job_id, 'status': 'pending', 'error': None, 'timings': None}
+
+
+def job_result_path(job_id: str) -> str:
+    return result_store.path(job_id)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import logging
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from typing import TYPE_CHECKING, Any
+
+from flask import Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from mybelts.config import SQL_STATEMENT_BUDGET
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the buckets; the last bucket is unbounded
+LATENCY_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+STATEMENTS_BOUNDS = (1, 2, 5, 10, 20, 50, 100)
+ROWS_BOUNDS = (1, 10, 100, 1000, 10000, 100000)
+
+
+class Histogram:
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def json(self) -> dict:
+        return {
+            'bounds': list(self.bounds),
+            'counts': self.counts,
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class EndpointMetrics:
+    def __init__(self) -> None:
+        self.latency = Histogram(LATENCY_BOUNDS)
+        self.statements = Histogram(STATEMENTS_BOUNDS)
+        self.db_time = Histogram(LATENCY_BOUNDS)
+        self.rows = Histogram(ROWS_BOUNDS)
+
+    def json(self) -> dict:
+        return {
+            'latency': self.latency.json(),
+            'statements': self.statements.json(),
+            'db_time': self.db_time.json(),
+            'rows': self.rows.json(),
+        }
+
+
+class RequestMetrics:
+    def __init__(self) -> None:
+        self.start = perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.rows = 0
+
+
+# in this process, by endpoint
+endpoint_metrics: dict[str, EndpointMetrics] = {}
+endpoint_metrics_lock = Lock()
+
+
+def current_request_metrics() -> RequestMetrics | None:
+    if not has_request_context():  # type: ignore
+        return None
+    request_metrics: RequestMetrics | None = g.get('request_metrics')
+    return request_metrics
+
+
+def before_cursor_execute(conn: Connection, *_args: Any) -> None:
+    if current_request_metrics() is not None:
+        conn.info.setdefault('statement_start', []).append(perf_counter())
+
+
+def after_cursor_execute(conn: Connection, cursor: Any, *_args: Any) -> None:
+    request_metrics = current_request_metrics()
+    if request_metrics is None or not conn.info.get('statement_start'):
+        return
+    request_metrics.statements += 1
+    request_metrics.db_time += perf_counter() - conn.info['statement_start'].pop()
+    if cursor.description is not None and cursor.rowcount > 0:
+        request_metrics.rows += cursor.rowcount
+
+
+# of all the engines: primary, read-only and replica
+event.listen(Engine, 'before_cursor_execute', before_cursor_execute)  # type: ignore
+event.listen(Engine, 'after_cursor_execute', after_cursor_execute)  # type: ignore
+
+
+def start_request_metrics() -> None:
+    if request.blueprint == 'api' and request.url_rule is not None:
+        g.request_metrics = RequestMetrics()
+
+
+def record_request_metrics(response: Response) -> Response:
+    request_metrics = g.pop('request_metrics', None)
+    if request_metrics is None:
+        return response
+    latency = perf_counter() - request_metrics.start
+    assert request.url_rule is not None
+    endpoint = f'{request.method} {request.url_rule.rule}'
+    with endpoint_metrics_lock:
+        metrics = endpoint_metrics.get(endpoint)
+        if metrics is None:
+            metrics = endpoint_metrics[endpoint] = EndpointMetrics()
+        metrics.latency.observe(latency)
+        metrics.statements.observe(request_metrics.statements)
+        metrics.db_time.observe(request_metrics.db_time)
+        metrics.rows.observe(request_metrics.rows)
+    if request_metrics.statements > SQL_STATEMENT_BUDGET:
+        logger.warning(
+            '%s issued %d SQL statements (budget is %d)',
+            endpoint,
+            request_metrics.statements,
+            SQL_STATEMENT_BUDGET,
+        )
+    return response
+
+
+def init_metrics(app: Flask) -> None:
+    app.before_request(start_request_metrics)
+    # registered last, so that it runs before the other after_request hooks
+    app.after_request(record_request_metrics)
+
+
+def reset_metrics() -> None:
+    # each worker reports its own requests
+    global endpoint_metrics_lock  # noqa: PLW0603
+    endpoint_metrics_lock = Lock()
+    endpoint_metrics.clear()
+
+
+def metrics_json() -> list[dict]:
+    with endpoint_metrics_lock:
+        return [
+            {
+                'endpoint': endpoint,
+                **metrics.json(),
+            }
+            for endpoint, metrics in sorted(endpoint_metrics.items())
+        ]
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+from typing import Any, Callable, TypeVar
+
+from gevent.monkey import is_module_patched  # type: ignore
+from gevent.threadpool import ThreadPool  # type: ignore
+from sqlalchemy_utils.types.password import Password  # type: ignore
+
+from mybelts.config import PASSWORD_QUEUE_SIZE, PASSWORD_THREADS
+from mybelts.schema import User
+
+T = TypeVar('T')
+
+# the passlib context of the password column, with the configured rounds
+context = User.__table__.c.password.type.context  # type: ignore
+
+# hashes being computed or waiting for a thread; never blocks, so it is safe
+# to use from greenlets even when created before monkey-patching
+pending = BoundedSemaphore(PASSWORD_QUEUE_SIZE)
+pool: tuple[int, ThreadPool | ThreadPoolExecutor] | None = None
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def get_pool() -> ThreadPool | ThreadPoolExecutor:
+    global pool  # noqa: PLW0603
+    # threads do not survive a fork, so create a pool in each worker
+    if pool is None or pool[0] != os.getpid():
+        if is_module_patched('threading'):
+            # real threads, so that the hashes do not block the event loop
+            pool = os.getpid(), ThreadPool(PASSWORD_THREADS)
+        else:
+            pool = os.getpid(), ThreadPoolExecutor(max_workers=PASSWORD_THREADS)
+    return pool[1]
+
+
+def run_in_pool(f: Callable[..., T], *args: Any) -> T:
+    # hashlib releases the GIL while hashing, so the threads run in parallel
+    if not pending.acquire(blocking=False):
+        raise QueueFullError
+    try:
+        p = get_pool()
+        if isinstance(p, ThreadPool):
+            return p.apply(f, args)  # type: ignore
+        return p.submit(f, *args).result()
+    finally:
+        pending.release()
+
+
+def map_in_pool(f: Callable[[Any], T], items: list[Any]) -> list[T]:
+    # a batch takes a single place in the queue, but uses all the threads
+    if not pending.acquire(blocking=False):
+        raise QueueFullError
+    try:
+        return list(get_pool().map(f, items))
+    finally:
+        pending.release()
+
+
+def hash_password(secret: str) -> Password:
+    return Password(run_in_pool(context.hash, secret))
+
+
+def hash_passwords(secrets: list[str]) -> list[Password]:
+    return [Password(password_hash) for password_hash in map_in_pool(context.hash, secrets)]
+
+
+def verify_password(secret: str, password: Password) -> tuple[bool, Password | None]:
+    """
+    Check a password against its stored hash
+
+    When the hash was computed with other parameters than the configured ones,
+    also return the password hashed again with the configured ones.
+    """
+    valid, new_hash = run_in_pool(context.verify_and_update, secret, password.hash)
+    return valid, None if new_hash is None else Password(new_hash)
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from time import monotonic
+from typing import TYPE_CHECKING, NamedTuple
+
+from mybelts.config import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL
+
+if TYPE_CHECKING:
+    from mybelts.schema import User
+
+
+class StudentPrincipal(NamedTuple):
+    id: int
+    class_id: int
+    can_register_to_waitlist: bool
+
+
+class Principal(NamedTuple):
+    """What the handlers need to know about the authenticated user"""
+    id: int
+    is_admin: bool
+    student: StudentPrincipal | None
+
+    @staticmethod
+    def of_user(user: User) -> Principal:
+        student = user.student
+        return Principal(
+            id=user.id,
+            is_admin=user.is_admin,
+            student=None if student is None else StudentPrincipal(
+                id=student.id,
+                class_id=student.class_id,
+                can_register_to_waitlist=student.can_register_to_waitlist,
+            ),
+        )
+
+
+# by token, with their expiration time, in this process
+cached_principals: dict[str, tuple[float, Principal]] = {}
+
+
+def get_cached_principal(token: str) -> Principal | None:
+    entry = cached_principals.get(token)
+    if entry is None:
+        return None
+    expires, principal = entry
+    if monotonic() >= expires:
+        cached_principals.pop(token, None)
+        return None
+    return principal
+
+
+def cache_principal(token: str, principal: Principal) -> None:
+    if len(cached_principals) >= PRINCIPAL_CACHE_SIZE:
+        cached_principals.clear()
+    cached_principals[token] = (monotonic() + PRINCIPAL_CACHE_TTL, principal)
+
+
+def forget_principals(user_id: int | None = None) -> None:
+    # other processes only notice the change when their entries expire
+    if user_id is None:
+        cached_principals.clear()
+        return
+    for token, (_, principal) in list(cached_principals.items()):
+        if principal.id == user_id:
+            cached_principals.pop(token, None)
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterable
+
+from sqlalchemy import Integer, and_, exists, func, text, tuple_, type_coerce
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, array_agg, insert
+
+from mybelts.schema import Belt, Evaluation, Student, StudentProgress
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Query, Session
+
+COLUMNS = ['student_id', 'skill_domain_id', 'belt_id', 'attempts']
+
+
+def computed_progress(session: Session) -> Query:
+    # the successful belt with the highest rank, among all the attempts
+    highest_belt_id = type_coerce(
+        array_agg(aggregate_order_by(Evaluation.belt_id, Belt.rank.desc())).filter(Evaluation.success),
+        ARRAY(Integer),
+    )[1]
+    query: Query = (
+        session  # type: ignore
+        .query(
+            Evaluation.student_id,
+            Evaluation.skill_domain_id,
+            highest_belt_id.label('belt_id'),
+            func.count().label('attempts'),
+        )
+        .join(Belt, Belt.id == Evaluation.belt_id)
+        .group_by(Evaluation.student_id, Evaluation.skill_domain_id)
+    )
+    return query
+
+
+def refresh_student_progress(session: Session, pairs: Iterable[tuple[int, int]]) -> None:
+    """
+    Compute again the progress of students in skill domains
+
+    The pairs are (student_id, skill_domain_id). Call it in the transaction
+    that changes their evaluations, after the changes.
+    """
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return
+    # serialize the refreshes of a student, so that the last one sees the
+    # evaluations added by the others; FOR NO KEY UPDATE does not conflict
+    # with the inserts of evaluations
+    (
+        session
+        .query(Student.id)
+        .filter(Student.id.in_({student_id for student_id, _ in pairs}))
+        .order_by(Student.id)
+        .with_for_update(key_share=True)
+        .all()
+    )
+    computed = computed_progress(session).filter(tuple_(Evaluation.student_id, Evaluation.skill_domain_id).in_(pairs))
+    statement = insert(StudentProgress).from_select(COLUMNS, computed.statement)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=[StudentProgress.student_id, StudentProgress.skill_domain_id],
+        set_={
+            'belt_id': statement.excluded.belt_id,
+            'attempts': statement.excluded.attempts,
+        },
+    ))
+    # no evaluation left
+    (
+        session
+        .query(StudentProgress)
+        .filter(tuple_(StudentProgress.student_id, StudentProgress.skill_domain_id).in_(pairs))
+        .filter(~exists().where(and_(
+            Evaluation.student_id == StudentProgress.student_id,
+            Evaluation.skill_domain_id == StudentProgress.skill_domain_id,
+        )))
+        .delete(synchronize_session=False)
+    )
+
+
+def progress_of_belts(session: Session, belt_ids: Iterable[int]) -> list[tuple[int, int]]:
+    # the progress that depends on these belts, to refresh it when they change
+    pairs: list[tuple[int, int]] = (
+        session  # type: ignore
+        .query(Evaluation.student_id, Evaluation.skill_domain_id)
+        .filter(Evaluation.belt_id.in_(list(belt_ids)))
+        .distinct()
+        .all()
+    )
+    return pairs
+
+
+def rebuild_student_progress(session: Session) -> None:
+    # block the refreshes until committed
+    session.execute(text('LOCK TABLE student_progress IN SHARE ROW EXCLUSIVE MODE'))
+    session.query(StudentProgress).delete()
+    session.execute(insert(StudentProgress).from_select(COLUMNS, computed_progress(session).statement))
+
+
+def check_student_progress(session: Session) -> list[str]:
+    """
+    Compare the progress table with the progress computed from the evaluations
+
+    Return the differences, if any.
+    """
+    stored = {
+        (progress.student_id, progress.skill_domain_id): (progress.belt_id, progress.attempts)
+        for progress in session.query(StudentProgress)
+    }
+    computed = {
+        (progress.student_id, progress.skill_domain_id): (progress.belt_id, progress.attempts)
+        for progress in computed_progress(session)
+    }
+    differences = []
+    for student_id, skill_domain_id in sorted(stored.keys() | computed.keys()):
+        expected = computed.get((student_id, skill_domain_id))
+        actual = stored.get((student_id, skill_domain_id))
+        if actual != expected:
+            differences.append(
+                f'student {student_id} in skill domain {skill_domain_id}: '
+                f'(belt, attempts) is {actual} instead of {expected}',
+            )
+    return differences
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+from mybelts.schema import Belt, ReferenceDataVersion, SkillDomain
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import scoped_session
+
+
+class ReferenceData(NamedTuple):
+    version: int
+    belts: list[dict]
+    skill_domains: list[dict]
+
+
+# serialized belts and skill domains, for this process
+cached_reference_data: ReferenceData | None = None
+
+
+def get_reference_data(session: scoped_session) -> ReferenceData:
+    """
+    Return the serialized belts and skill domains
+
+    They are only queried again when another request, in any process, changed
+    them, which costs a primary key lookup instead of two full queries.
+    """
+    global cached_reference_data  # noqa: PLW0603
+    version: int = session.query(ReferenceDataVersion.version).scalar()  # type: ignore
+    reference_data = cached_reference_data
+    if reference_data is None or reference_data.version != version:
+        # the data is at least as recent as the version read before it
+        reference_data = cached_reference_data = ReferenceData(
+            version=version,
+            belts=[belt.json() for belt in session.query(Belt)],
+            skill_domains=[skill_domain.json() for skill_domain in session.query(SkillDomain)],
+        )
+    return reference_data
+
+
+def forget_reference_data() -> None:
+    global cached_reference_data  # noqa: PLW0603
+    cached_reference_data = None
+
+
+def bump_reference_data_version(session: scoped_session) -> None:
+    # in the transaction that changes belts or skill domains
+    (
+        session
+        .query(ReferenceDataVersion)
+        .update({ReferenceDataVersion.version: ReferenceDataVersion.version + 1})
+    )
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 from contextlib import contextmanager
-from typing import TYPE_CHECKING, Iterator, TypeVar
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Iterator
 
 from sqlalchemy import (
     Boolean,
+    CheckConstraint,
     Column,
     Date,
     DateTime,
@@ -13,39 +15,138 @@ from sqlalchemy import (
     LargeBinary,
     String,
     UniqueConstraint,
-    create_engine,
     func,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, scoped_session, sessionmaker
+from sqlalchemy.util import ThreadLocalRegistry
 from sqlalchemy_utils.types.password import PasswordType  # type: ignore
 
-from mybelts.config import POSTGRES_URI
+from mybelts.config import (
+    PASSWORD_ROUNDS,
+    POSTGRES_URI,
+    REPLICA_LAG_CHECK_INTERVAL,
+    REPLICA_MAX_LAG,
+    REPLICA_POSTGRES_URI,
+    REPLICA_TIMEOUT,
+)
+from mybelts.database import connect_session, create_database_engine, measure_replica_lag, pool_stats
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
 
-engine = create_engine(POSTGRES_URI)
+engine = create_database_engine()
 session_factory = scoped_session(sessionmaker(bind=engine))
 Base = declarative_base(bind=engine)
 
+# nothing to flush, since nothing is written
+read_engine = create_database_engine(POSTGRES_URI, read_only=True)
+read_session_factory = scoped_session(sessionmaker(bind=read_engine, autoflush=False))
 
-if TYPE_CHECKING:
-    # deferred() is not properly typed in sqlalchemy-stubs
-    U = TypeVar('U')
 
-    def deferred(_x: U) -> U:
-        ...
-else:
-    from sqlalchemy.orm import deferred
+class Replica:
+    """
+    Streaming replica of the database, for the read-only sessions
+
+    Its lag is measured at most once per REPLICA_LAG_CHECK_INTERVAL; until it
+    is known, while it is measured, and after a failure, the primary is read
+    instead.
+    """
+
+    def __init__(self, uri: str) -> None:
+        self.engine = create_database_engine(uri, read_only=True, connect_timeout=REPLICA_TIMEOUT)
+        self.session_factory = scoped_session(sessionmaker(bind=self.engine, autoflush=False))
+        self.reset()
+
+    def reset(self) -> None:
+        self.lag: float | None = None
+        self.checked: float | None = None
+        self.checking = False
+
+    def is_usable(self) -> bool:
+        if self.checking:
+            # the other greenlets read the primary meanwhile
+            return False
+        if self.checked is None or monotonic() - self.checked >= REPLICA_LAG_CHECK_INTERVAL:
+            self.checking = True
+            try:
+                self.lag = measure_replica_lag(self.engine, read_engine, REPLICA_TIMEOUT)
+            finally:
+                self.checked = monotonic()
+                self.checking = False
+        return self.lag is not None and self.lag <= REPLICA_MAX_LAG
+
+    def connect(self, session: Session) -> bool:
+        # until the next check, the primary is read when the replica fails
+        if connect_session(session, REPLICA_TIMEOUT):
+            return True
+        self.lag = None
+        self.checked = monotonic()
+        return False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'lag': self.lag,
+            'pool': pool_stats(self.engine),
+        }
+
+
+replica = None if REPLICA_POSTGRES_URI is None else Replica(REPLICA_POSTGRES_URI)
+
+
+def has_replica() -> bool:
+    return replica is not None
+
+
+def replica_stats() -> dict[str, Any] | None:
+    return None if replica is None else replica.stats()
+
+
+def reset_database_connections() -> None:
+    """
+    Give a new worker its own connections and sessions
+
+    The connections of the parent are left to it. A thread-local created
+    before gevent patched threading would be shared by all the greenlets of
+    the worker.
+    """
+    engines = [engine, read_engine]
+    factories = [session_factory, read_session_factory]
+    if replica is not None:
+        engines.append(replica.engine)
+        factories.append(replica.session_factory)
+        replica.reset()
+    for worker_engine in engines:
+        worker_engine.dispose(close=False)  # type: ignore
+    for factory in factories:
+        factory.registry = ThreadLocalRegistry(factory.session_factory)
 
 
 @contextmanager
-def session_context() -> Iterator[scoped_session]:
+def session_context(read_only: bool = False, from_replica: bool = False) -> Iterator[scoped_session]:
     """
     (straight from SQLAlchemy's documentation)
     Provides a transactional scope around a series of operations.
     The session is committed on exit : DON'T DO IT YOURSELF
+
+    With read_only, the session reads through read_engine, and is neither
+    flushed nor committed. With from_replica as well, it reads from the
+    replica, if any and not too late.
     """
+    if read_only:
+        factory = read_session_factory
+        if from_replica and replica is not None and replica.is_usable():
+            if replica.connect(replica.session_factory()):
+                factory = replica.session_factory
+            else:
+                replica.session_factory.remove()  # type: ignore
+        try:
+            yield factory()
+        finally:
+            factory.remove()  # type: ignore
+        return
     session = session_factory()
     try:
         yield session
@@ -60,16 +161,17 @@ def session_context() -> Iterator[scoped_session]:
 class HTTPRequest(Base):
     __tablename__ = 'http_request'
     id = Column(Integer, primary_key=True)
+    # only indexed by time, to keep inserts cheap
     created = Column(DateTime(timezone=True), nullable=False, index=True, server_default=func.now())
-    request_remote_addr = Column(String, nullable=False, index=True)
-    request_method = Column(String, nullable=False, index=True)
-    request_url = Column(String, nullable=False, index=True)
-    request_path = Column(String, nullable=False, index=True)
-    request_headers = Column(JSONB, nullable=False, index=True)
+    request_remote_addr = Column(String, nullable=False)
+    request_method = Column(String, nullable=False)
+    request_url = Column(String, nullable=False)
+    request_path = Column(String, nullable=False)
+    request_headers = Column(JSONB, nullable=False)
     request_body = Column(LargeBinary)
-    response_status_code = Column(Integer, nullable=False, index=True)
-    response_status = Column(String, nullable=False, index=True)
-    response_headers = Column(JSONB, nullable=False, index=True)
+    response_status_code = Column(Integer, nullable=False)
+    response_status = Column(String, nullable=False)
+    response_headers = Column(JSONB, nullable=False)
     response_body = Column(LargeBinary)
 
 
@@ -82,12 +184,36 @@ class MissingI18nKey(Base):
     key = Column(String, nullable=False, index=True)
 
 
+class MissingI18nKeyCount(Base):
+    # one row per missing key, updated along with the events
+    __tablename__ = 'missing_i18n_key_count'
+    language = Column(String, primary_key=True)
+    namespace = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+    first_seen = Column(DateTime(timezone=True), nullable=False)
+    last_seen = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class ReferenceDataVersion(Base):
+    # single row, bumped whenever belts or skill domains change
+    __tablename__ = 'reference_data_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, server_default='0')
+
+
 class User(Base):
     __tablename__ = 'user'
     id = Column(Integer, primary_key=True)
     created = Column(DateTime(timezone=True), nullable=False, index=True, server_default=func.now())
     username = Column(String, nullable=False, index=True, unique=True)
-    password = Column(PasswordType(schemes=['pbkdf2_sha512']), nullable=False)
+    password = Column(PasswordType(
+        schemes=['pbkdf2_sha512'],
+        # hashes with other rounds need an update
+        pbkdf2_sha512__default_rounds=PASSWORD_ROUNDS,
+        pbkdf2_sha512__min_rounds=PASSWORD_ROUNDS,
+        pbkdf2_sha512__max_rounds=PASSWORD_ROUNDS,
+    ), nullable=False)
     is_admin = Column(Boolean, nullable=False, index=True, default=False)
     last_login = Column(DateTime(timezone=True), index=True)
 
@@ -207,6 +333,14 @@ class Belt(Base):
     code = Column(String, nullable=False, index=True, server_default='')
     color = Column(String, nullable=False, index=True, server_default='')
 
+    # the ranks go from 1 to the number of belts: they are unique and positive,
+    # and a trigger checks the highest one; all at commit, so that belts can be
+    # moved around within a transaction
+    __table_args__ = (
+        UniqueConstraint('rank', name='belt_rank_key', deferrable=True, initially='DEFERRED'),
+        CheckConstraint('rank >= 1', name='belt_rank_positive'),
+    )
+
     def json(self) -> dict:
         return {
             'id': self.id,
@@ -263,6 +397,18 @@ class Evaluation(Base):
         }
 
 
+class StudentProgress(Base):
+    """
+    Highest belt achieved by a student in a skill domain, derived from the
+    evaluations; see mybelts.progress
+    """
+    __tablename__ = 'student_progress'
+    student_id = Column(Integer, ForeignKey('student.id', ondelete='CASCADE'), primary_key=True)
+    skill_domain_id = Column(Integer, ForeignKey('skill_domain.id', ondelete='CASCADE'), primary_key=True)
+    belt_id = Column(Integer, ForeignKey('belt.id', ondelete='SET NULL'), nullable=True, index=True)
+    attempts = Column(Integer, nullable=False)
+
+
 class WaitlistEntry(Base):
     __tablename__ = 'waitlist_entry'
     id = Column(Integer, primary_key=True)
@@ -311,7 +457,8 @@ class Exam(Base):
     skill_domain_id = Column(Integer, ForeignKey('skill_domain.id', ondelete='CASCADE'), nullable=False)
     filename = Column(String, nullable=False, index=True)
     code = Column(String, nullable=False, index=True, server_default='')
-    file = deferred(Column(LargeBinary, nullable=False))
+    # SHA-256 of the content, in the blob store
+    file_hash = Column(String, nullable=False, index=True)
 
     level = relationship(
         'Level',
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from mybelts.audit import audit_writer
+from mybelts.database import make_psycopg2_cooperative
+from mybelts.metrics import reset_metrics
+from mybelts.principals import forget_principals
+from mybelts.referencedata import forget_reference_data
+from mybelts.schema import reset_database_connections
+
+
+def init_worker() -> None:
+    """
+    Prepare a worker forked from a process that already imported the application
+
+    With --preload, gunicorn imports the application once, before forking the
+    workers, and gevent only patches the standard library in each worker. Call
+    it after the patching (post_worker_init), before serving requests.
+    """
+    # the new pools also get their own statistics and queues that greenlets
+    # can wait on
+    reset_database_connections()
+    make_psycopg2_cooperative()
+    # the caches of each worker start empty
+    forget_principals()
+    forget_reference_data()
+    reset_metrics()
+    audit_writer.reset()
+    # the thread pools of passwords and print jobs are created on first use,
+    # in each worker
@@ -14,11 +14,11 @@ interface RowProps {
     belt: Belt;
     is_last: boolean;
     setBelts: Dispatch<(prevBelts: Belt[]) => Belt[]>;
-    setErrorMessage: (errorMessage: string) => void;
+    onMove: (belt_id: number, direction: number) => void;
 }
 
 function BeltListingRow_(props: RowProps) {
-    const { belt, is_last, setBelts, setErrorMessage } = props;
+    const { belt, is_last, setBelts, onMove } = props;
 
     const changedCallback = (nextBelt: Belt) => {
         setBelts((prevBelts) => {
@@ -71,8 +71,7 @@ function BeltListingRow_(props: RowProps) {
                         direction={-1}
                         belt={belt}
                         is_last={is_last}
-                        setBelts={setBelts}
-                        setErrorMessage={setErrorMessage}
+                        onMove={onMove}
                     />{' '}
                     <BeltMoveButton
                         buttonContent="↓"
@@ -80,8 +79,7 @@ function BeltListingRow_(props: RowProps) {
                         direction={1}
                         belt={belt}
                         is_last={is_last}
-                        setBelts={setBelts}
-                        setErrorMessage={setErrorMessage}
+                        onMove={onMove}
                     />{' '}
                     <BeltEditButton
                         belt={belt}
@@ -102,11 +100,11 @@ const BeltListingRow = React.memo(BeltListingRow_);
 interface Props {
     belts: Belt[];
     setBelts: Dispatch<(prevBelts: Belt[]) => Belt[]>;
-    setErrorMessage: Dispatch<string>;
+    onMove: (belt_id: number, direction: number) => void;
 }
 
 export default function BeltListing(props: Props): ReactElement {
-    const { belts, setBelts, setErrorMessage } = props;
+    const { belts, setBelts, onMove } = props;
     const { t } = useTranslation();
 
     return (
@@ -130,7 +128,7 @@ export default function BeltListing(props: Props): ReactElement {
                             belt={belt}
                             is_last={index === belts.length - 1}
                             setBelts={setBelts}
-                            setErrorMessage={setErrorMessage}
+                            onMove={onMove}
                         />
                     ))}
                 </tbody>
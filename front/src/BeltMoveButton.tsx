@@ -1,13 +1,11 @@
 import React from 'react';
-import { Dispatch, ReactElement, useState } from 'react';
+import { ReactElement } from 'react';
 import { useTranslation } from 'react-i18next';
 import Button from 'react-bootstrap/Button';
 import OverlayTrigger from 'react-bootstrap/OverlayTrigger';
-import Spinner from 'react-bootstrap/Spinner';
 import Tooltip from 'react-bootstrap/Tooltip';
 
-import { Belt, BeltsService } from './api';
-import { getAPIError } from './lib';
+import { Belt } from './api';
 
 interface Props {
     buttonContent: string;
@@ -15,50 +13,13 @@ interface Props {
     direction: number;
     belt: Belt;
     is_last: boolean;
-    setBelts: Dispatch<(prevBelts: Belt[]) => Belt[]>;
-    setErrorMessage: Dispatch<string>;
+    onMove: (belt_id: number, direction: number) => void;
 }
 
 export default function BeltMoveButton(props: Props): ReactElement {
-    const {
-        buttonContent,
-        direction_key,
-        direction,
-        belt,
-        is_last,
-        setBelts,
-        setErrorMessage,
-    } = props;
+    const { buttonContent, direction_key, direction, belt, is_last, onMove } =
+        props;
     const { t } = useTranslation();
-    const [moving, setMoving] = useState(false);
-
-    function handleMove() {
-        setMoving(true);
-        setErrorMessage('');
-        BeltsService.patchBeltRankResource(belt.id, {
-            increase_by: direction,
-        })
-            .then(() =>
-                setBelts((prevBelts) => {
-                    setMoving(false);
-                    const nextBelts = [...prevBelts];
-                    const other_belt = nextBelts[belt.rank + direction - 1];
-                    if (other_belt === undefined) {
-                        console.error('Failed to find other belt');
-                        return nextBelts;
-                    }
-                    // adjust belt list
-                    [belt.rank, other_belt.rank] = [other_belt.rank, belt.rank];
-                    nextBelts[belt.rank - 1] = belt;
-                    nextBelts[other_belt.rank - 1] = other_belt;
-                    return nextBelts;
-                })
-            )
-            .catch((error) => {
-                setMoving(false);
-                setErrorMessage(getAPIError(error));
-            });
-    }
 
     return (
         <>
@@ -69,22 +30,14 @@ export default function BeltMoveButton(props: Props): ReactElement {
                     </Tooltip>
                 }
             >
-                {moving ? (
-                    <Button disabled>
-                        <Spinner animation="border" role="status" size="sm">
-                            <span className="visually-hidden">
-                                {t('belt.move.' + direction_key + '.title')}
-                            </span>
-                        </Spinner>
-                    </Button>
-                ) : (
-                    <Button
-                        disabled={belt.rank + direction <= 0 || is_last}
-                        onClick={handleMove}
-                    >
-                        {buttonContent}
-                    </Button>
-                )}
+                <Button
+                    disabled={
+                        belt.rank + direction <= 0 || (direction > 0 && is_last)
+                    }
+                    onClick={() => onMove(belt.id, direction)}
+                >
+                    {buttonContent}
+                </Button>
             </OverlayTrigger>
         </>
     );
@@ -3,6 +3,8 @@ import { ReactElement, useEffect, useState } from 'react';
 import { useTranslation } from 'react-i18next';
 import Alert from 'react-bootstrap/Alert';
 import Breadcrumb from 'react-bootstrap/Breadcrumb';
+import Button from 'react-bootstrap/Button';
+import Spinner from 'react-bootstrap/Spinner';
 import { Belt, BeltList, BeltsService } from './api';
 import { getAPIError } from './lib';
 import { AdminOnly } from './auth';
@@ -28,6 +30,36 @@ export default function BeltsView(): ReactElement {
         [setBeltList]
     );
 
+    // moved locally, then saved at once
+    const [orderChanged, setOrderChanged] = useState(false);
+    const [savingOrder, setSavingOrder] = useState(false);
+
+    const onMove = useCallback(
+        (belt_id: number, direction: number) => {
+            setBelts((prevBelts) => {
+                const nextBelts = [...prevBelts].sort(
+                    (a, b) => a.rank - b.rank
+                );
+                const index = nextBelts.findIndex(
+                    (belt) => belt.id === belt_id
+                );
+                const belt = nextBelts[index];
+                const other_belt = nextBelts[index + direction];
+                if (belt === undefined || other_belt === undefined) {
+                    return prevBelts;
+                }
+                nextBelts[index] = { ...belt, rank: other_belt.rank };
+                nextBelts[index + direction] = {
+                    ...other_belt,
+                    rank: belt.rank,
+                };
+                return nextBelts;
+            });
+            setOrderChanged(true);
+        },
+        [setBelts]
+    );
+
     useEffect(() => {
         BeltsService.getBeltsResource()
             .then(setBeltList)
@@ -60,6 +92,24 @@ export default function BeltsView(): ReactElement {
     const { belts } = beltList;
 
     const sorted_belts = belts.sort((a, b) => a.rank - b.rank);
+
+    function handleSaveOrder() {
+        setSavingOrder(true);
+        setErrorMessage('');
+        BeltsService.putBeltRanksResource({
+            belt_ids: sorted_belts.map((belt) => belt.id),
+        })
+            .then(({ belts: savedBelts }) => {
+                setSavingOrder(false);
+                setOrderChanged(false);
+                setBelts(() => savedBelts);
+            })
+            .catch((error) => {
+                setSavingOrder(false);
+                setErrorMessage(getAPIError(error));
+            });
+    }
+
     // TODO: handle case where result is false
     sorted_belts.reduce((previous, belt, index) => {
         if (belt.rank !== index + 1) {
@@ -97,8 +147,25 @@ export default function BeltsView(): ReactElement {
             <BeltListing
                 belts={sorted_belts}
                 setBelts={setBelts}
-                setErrorMessage={setErrorMessage}
+                onMove={onMove}
             />
+            {orderChanged && (
+                <AdminOnly>
+                    {savingOrder ? (
+                        <Button disabled>
+                            <Spinner animation="border" role="status" size="sm">
+                                <span className="visually-hidden">
+                                    {t('belt.order.in_process')}
+                                </span>
+                            </Spinner>
+                        </Button>
+                    ) : (
+                        <Button onClick={handleSaveOrder}>
+                            {t('belt.order.save')}
+                        </Button>
+                    )}
+                </AdminOnly>
+            )}
         </>
     );
 }
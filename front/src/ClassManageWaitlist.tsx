@@ -2,7 +2,7 @@ import React from 'react';
 import {
     Dispatch,
     ReactElement,
-    SetStateAction,
+    useCallback,
     useMemo,
     useState,
 } from 'react';
@@ -11,6 +11,7 @@ import Alert from 'react-bootstrap/Alert';
 import Button from 'react-bootstrap/Button';
 import Modal from 'react-bootstrap/Modal';
 import OverlayTrigger from 'react-bootstrap/OverlayTrigger';
+import Spinner from 'react-bootstrap/Spinner';
 import Tooltip from 'react-bootstrap/Tooltip';
 import { ColumnDef } from '@tanstack/react-table';
 
@@ -18,31 +19,36 @@ import {
     Belt,
     Level,
     Class,
+    ClassesService,
     ClassStudentBeltsStudentBelts,
     SkillDomain,
     Student,
-    WaitlistEntry,
     WaitlistMapping,
 } from './api';
+import { getAPIError } from './lib';
 import SortTable from './SortTable';
 import ClassManageWaitlistButton from './ClassManageWaitlistButton';
 
+// belt_id by skill_domain_id
+type DesiredBelts = { [index: number]: number };
+
 interface DataRow {
-    waitlist_entries: WaitlistEntry[];
+    desired_belts: DesiredBelts;
     student: Student;
 }
 
 interface RowProps {
     student: Student;
-    waitlist_entries: WaitlistEntry[];
+    desired_belts: DesiredBelts;
     this_belts: { belt_id: number; skill_domain_id: number }[];
     sorted_skill_domains: SkillDomain[];
     belt_by_id: { [index: number]: Belt };
     belt_by_rank: { [index: number]: Belt };
-    setErrorMessage: Dispatch<SetStateAction<string>>;
-    setWaitlistMappings: Dispatch<
-        (prevState: WaitlistMapping[]) => WaitlistMapping[]
-    >;
+    onToggle: (
+        student_id: number,
+        skill_domain_id: number,
+        belt_id: number
+    ) => void;
 }
 
 function WaitlistRow_(props: RowProps) {
@@ -52,66 +58,10 @@ function WaitlistRow_(props: RowProps) {
         sorted_skill_domains,
         belt_by_id,
         belt_by_rank,
-        waitlist_entries,
-        setErrorMessage,
-        setWaitlistMappings,
+        desired_belts,
+        onToggle,
     } = props;
 
-    const setWaitlistEntries = (
-        setStateAction: (
-            prevWaitlistEntries: WaitlistEntry[]
-        ) => WaitlistEntry[]
-    ) =>
-        setWaitlistMappings((prevWaitlistMappings) => {
-            let index = prevWaitlistMappings.findIndex(
-                (candidate) => candidate.student_id === student.id
-            );
-            let prevWaitlistMapping = prevWaitlistMappings?.[index];
-            // add mapping if none exist
-            if (prevWaitlistMapping === undefined) {
-                index = prevWaitlistMappings.length;
-                prevWaitlistMapping = {
-                    student_id: student.id,
-                    waitlist_entries: [],
-                };
-                prevWaitlistMappings.push(prevWaitlistMapping);
-            }
-            const prevWaitlistEntries = prevWaitlistMapping.waitlist_entries;
-            const nextWaitlistEntries = setStateAction(prevWaitlistEntries);
-            const nextWaitlistMapping = {
-                student_id: student.id,
-                waitlist_entries: nextWaitlistEntries,
-            };
-            const nextWaitlistMappings = [...prevWaitlistMappings];
-            nextWaitlistMappings[index] = nextWaitlistMapping;
-            return nextWaitlistMappings;
-        });
-
-    const waitlist_entry_by_domain = Object.fromEntries(
-        waitlist_entries.map((waitlist_entry) => [
-            waitlist_entry.skill_domain_id,
-            waitlist_entry,
-        ])
-    );
-
-    const onCreate = (nextWaitlistEntry: WaitlistEntry) =>
-        setWaitlistEntries((prevWaitlistEntries) => {
-            return [...prevWaitlistEntries, nextWaitlistEntry];
-        });
-
-    const onDelete = (waitlist_entry_id: number) =>
-        setWaitlistEntries((prevWaitlistEntries) => {
-            const index = prevWaitlistEntries.findIndex(
-                (candidate) => candidate.id === waitlist_entry_id
-            );
-            if (index === undefined) {
-                return prevWaitlistEntries;
-            }
-            const nextWaitlistEntries = [...prevWaitlistEntries];
-            nextWaitlistEntries.splice(index, 1);
-            return nextWaitlistEntries;
-        });
-
     return (
         <tr>
             <td>{student.rank}</td>
@@ -134,18 +84,16 @@ function WaitlistRow_(props: RowProps) {
                 if (!next_belt) {
                     return <td key={skill_domain.id}></td>;
                 }
-                const waitlist_entry =
-                    waitlist_entry_by_domain?.[skill_domain.id];
                 return (
                     <td key={skill_domain.id}>
                         <ClassManageWaitlistButton
                             student={student}
                             belt={next_belt}
                             skill_domain={skill_domain}
-                            waitlist_entry={waitlist_entry}
-                            setErrorMessage={setErrorMessage}
-                            onCreate={onCreate}
-                            onDelete={onDelete}
+                            waiting={
+                                desired_belts[skill_domain.id] !== undefined
+                            }
+                            onToggle={onToggle}
                         />
                     </td>
                 );
@@ -229,14 +177,71 @@ export default function ClassManageWaitlist(props: Props): ReactElement {
     const i18nPrefix = 'waitlist.manage';
     const i18nArgs = { level, class: class_ };
     const [show, setShow] = useState(false);
+    const [in_process, setIn_process] = useState(false);
 
-    const waitlist_entries_by_student_id = Object.fromEntries(
-        waitlist_mappings.map(({ student_id, waitlist_entries }) => [student_id, waitlist_entries])
+    // edited locally, then saved at once
+    const [desired_belts_by_student_id, setDesired_belts_by_student_id] =
+        useState<{ [index: number]: DesiredBelts }>({});
+
+    function handleShow() {
+        setErrorMessage('');
+        setDesired_belts_by_student_id(
+            Object.fromEntries(
+                waitlist_mappings.map(({ student_id, waitlist_entries }) => [
+                    student_id,
+                    Object.fromEntries(
+                        waitlist_entries.map(({ skill_domain_id, belt_id }) => [
+                            skill_domain_id,
+                            belt_id,
+                        ])
+                    ),
+                ])
+            )
+        );
+        setShow(true);
+    }
+
+    const onToggle = useCallback(
+        (student_id: number, skill_domain_id: number, belt_id: number) =>
+            setDesired_belts_by_student_id((prev) => {
+                const next_desired_belts = { ...prev[student_id] };
+                if (next_desired_belts[skill_domain_id] === undefined) {
+                    next_desired_belts[skill_domain_id] = belt_id;
+                } else {
+                    delete next_desired_belts[skill_domain_id];
+                }
+                return { ...prev, [student_id]: next_desired_belts };
+            }),
+        []
     );
 
+    function handleSave() {
+        setIn_process(true);
+        setErrorMessage('');
+        const waitlist_entries = Object.entries(
+            desired_belts_by_student_id
+        ).flatMap(([student_id, desired_belts]) =>
+            Object.entries(desired_belts).map(([skill_domain_id, belt_id]) => ({
+                student_id: Number(student_id),
+                skill_domain_id: Number(skill_domain_id),
+                belt_id,
+            }))
+        );
+        ClassesService.putClassWaitlistResource(class_.id, { waitlist_entries })
+            .then(({ waitlist_mappings: new_waitlist_mappings }) => {
+                setIn_process(false);
+                setWaitlistMappings(() => new_waitlist_mappings);
+                setShow(false);
+            })
+            .catch((error) => {
+                setIn_process(false);
+                setErrorMessage(getAPIError(error));
+            });
+    }
+
     const data = students.map((student) => {
-        const waitlist_entries = waitlist_entries_by_student_id[student.id] || [];
-        return { student, waitlist_entries };
+        const desired_belts = desired_belts_by_student_id[student.id] || {};
+        return { student, desired_belts };
     });
 
     const rowComponent = useMemo(() => {
@@ -254,31 +259,24 @@ export default function ClassManageWaitlist(props: Props): ReactElement {
         );
 
         function RowComponent(row: DataRow) {
-            const { student, waitlist_entries } = row;
+            const { student, desired_belts } = row;
 
             const this_belts = student_belts_by_student_id[student.id] || [];
             return (
                 <WaitlistRow
                     key={student.id}
                     student={student}
-                    waitlist_entries={waitlist_entries}
+                    desired_belts={desired_belts}
                     this_belts={this_belts}
                     sorted_skill_domains={sorted_skill_domains}
                     belt_by_id={belt_by_id}
                     belt_by_rank={belt_by_rank}
-                    setErrorMessage={setErrorMessage}
-                    setWaitlistMappings={setWaitlistMappings}
+                    onToggle={onToggle}
                 />
             );
         }
         return RowComponent;
-    }, [
-        belts,
-        setErrorMessage,
-        setWaitlistMappings,
-        sorted_skill_domains,
-        student_belts,
-    ]);
+    }, [belts, onToggle, sorted_skill_domains, student_belts]);
 
     return (
         <>
@@ -289,7 +287,7 @@ export default function ClassManageWaitlist(props: Props): ReactElement {
                     </Tooltip>
                 }
             >
-                <Button onClick={() => setShow(true)}>
+                <Button onClick={handleShow}>
                     {t(i18nPrefix + '.button', i18nArgs)}
                 </Button>
             </OverlayTrigger>
@@ -321,6 +319,19 @@ export default function ClassManageWaitlist(props: Props): ReactElement {
                     <Button variant="secondary" onClick={() => setShow(false)}>
                         {t(i18nPrefix + '.close', i18nArgs)}
                     </Button>
+                    {in_process ? (
+                        <Button disabled>
+                            <Spinner animation="border" role="status" size="sm">
+                                <span className="visually-hidden">
+                                    {t(i18nPrefix + '.in_process', i18nArgs)}
+                                </span>
+                            </Spinner>
+                        </Button>
+                    ) : (
+                        <Button onClick={handleSave}>
+                            {t(i18nPrefix + '.save', i18nArgs)}
+                        </Button>
+                    )}
                 </Modal.Footer>
             </Modal>
         </>
@@ -10,6 +10,7 @@ export type { BeltList } from './models/BeltList';
 export type { BeltOne } from './models/BeltOne';
 export type { BeltPut } from './models/BeltPut';
 export type { BeltRank } from './models/BeltRank';
+export type { BeltRanks } from './models/BeltRanks';
 export type { BeltsPost } from './models/BeltsPost';
 export type { Class } from './models/Class';
 export type { ClassesPost } from './models/ClassesPost';
@@ -19,6 +20,8 @@ export type { ClassOne } from './models/ClassOne';
 export type { ClassPut } from './models/ClassPut';
 export type { ClassStudentBeltsBelts } from './models/ClassStudentBeltsBelts';
 export type { ClassStudentBeltsStudentBelts } from './models/ClassStudentBeltsStudentBelts';
+export type { ClassWaitlistPut } from './models/ClassWaitlistPut';
+export type { ClassWaitlistPutWaitlistEntry } from './models/ClassWaitlistPutWaitlistEntry';
 export type { CompletedEvaluation } from './models/CompletedEvaluation';
 export type { CompletedEvaluationList } from './models/CompletedEvaluationList';
 export type { Evaluation } from './models/Evaluation';
@@ -41,6 +44,7 @@ export type { MissingI18nKeyEvent } from './models/MissingI18nKeyEvent';
 export type { MissingI18nKeyEventCount } from './models/MissingI18nKeyEventCount';
 export type { MissingI18nKeyEventList } from './models/MissingI18nKeyEventList';
 export type { MissingI18nKeyPost } from './models/MissingI18nKeyPost';
+export type { MissingI18nKeysPost } from './models/MissingI18nKeysPost';
 export type { SkillDomain } from './models/SkillDomain';
 export type { SkillDomainList } from './models/SkillDomainList';
 export type { SkillDomainOne } from './models/SkillDomainOne';
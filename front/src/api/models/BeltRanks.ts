@@ -0,0 +1,10 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type BeltRanks = {
+    /**
+     * All the belts, in order
+     */
+    belt_ids: Array<number>;
+}
@@ -0,0 +1,9 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { ClassWaitlistPutWaitlistEntry } from './ClassWaitlistPutWaitlistEntry';
+
+export type ClassWaitlistPut = {
+    waitlist_entries: Array<ClassWaitlistPutWaitlistEntry>;
+}
@@ -0,0 +1,9 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+export type ClassWaitlistPutWaitlistEntry = {
+    student_id: number;
+    skill_domain_id: number;
+    belt_id: number;
+}
@@ -0,0 +1,9 @@
+/* istanbul ignore file */
+/* tslint:disable */
+/* eslint-disable */
+
+import type { MissingI18nKeyPost } from './MissingI18nKeyPost';
+
+export type MissingI18nKeysPost = {
+    events: Array<MissingI18nKeyPost>;
+}
@@ -5,6 +5,7 @@ import type { BeltList } from '../models/BeltList';
 import type { BeltOne } from '../models/BeltOne';
 import type { BeltPut } from '../models/BeltPut';
 import type { BeltRank } from '../models/BeltRank';
+import type { BeltRanks } from '../models/BeltRanks';
 import type { BeltsPost } from '../models/BeltsPost';
 import type { CancelablePromise } from '../core/CancelablePromise';
 import { request as __request } from '../core/request';
@@ -106,4 +107,24 @@ export class BeltsService {
         });
     }
 
+    /**
+     * @param payload
+     * @param xFields An optional fields mask
+     * @returns BeltList Success
+     * @throws ApiError
+     */
+    public static putBeltRanksResource(
+        payload: BeltRanks,
+        xFields?: string,
+    ): CancelablePromise<BeltList> {
+        return __request({
+            method: 'PUT',
+            path: `/belts/ranks`,
+            headers: {
+                'X-Fields': xFields,
+            },
+            body: payload,
+        });
+    }
+
 }
\ No newline at end of file
@@ -5,6 +5,7 @@ import type { ClassesPost } from '../models/ClassesPost';
 import type { ClassExamPdfPost } from '../models/ClassExamPdfPost';
 import type { ClassOne } from '../models/ClassOne';
 import type { ClassPut } from '../models/ClassPut';
+import type { ClassWaitlistPut } from '../models/ClassWaitlistPut';
 import type { StudentList } from '../models/StudentList';
 import type { WaitlistMappingList } from '../models/WaitlistMappingList';
 import type { CancelablePromise } from '../core/CancelablePromise';
@@ -123,4 +124,26 @@ export class ClassesService {
         });
     }
 
+    /**
+     * @param classId
+     * @param payload
+     * @param xFields An optional fields mask
+     * @returns WaitlistMappingList Success
+     * @throws ApiError
+     */
+    public static putClassWaitlistResource(
+        classId: number,
+        payload: ClassWaitlistPut,
+        xFields?: string,
+    ): CancelablePromise<WaitlistMappingList> {
+        return __request({
+            method: 'PUT',
+            path: `/classes/${classId}/waitlist`,
+            headers: {
+                'X-Fields': xFields,
+            },
+            body: payload,
+        });
+    }
+
 }
\ No newline at end of file
@@ -5,6 +5,7 @@ import type { LoginInfo } from '../models/LoginInfo';
 import type { LoginPost } from '../models/LoginPost';
 import type { MissingI18nKeyEventList } from '../models/MissingI18nKeyEventList';
 import type { MissingI18nKeyPost } from '../models/MissingI18nKeyPost';
+import type { MissingI18nKeysPost } from '../models/MissingI18nKeysPost';
 import type { CancelablePromise } from '../core/CancelablePromise';
 import { request as __request } from '../core/request';
 
@@ -62,4 +63,19 @@ export class DefaultService {
         });
     }
 
+    /**
+     * @param payload
+     * @returns void
+     * @throws ApiError
+     */
+    public static postMissingI18NKeysResource(
+        payload: MissingI18nKeysPost,
+    ): CancelablePromise<void> {
+        return __request({
+            method: 'POST',
+            path: `/missing-i18n-keys`,
+            body: payload,
+        });
+    }
+
 }
\ No newline at end of file
@@ -2,7 +2,7 @@ import i18n from 'i18next';
 import { initReactI18next } from 'react-i18next';
 import LanguageDetector from 'i18next-browser-languagedetector';
 
-import { DefaultService } from './api';
+import { DefaultService, MissingI18nKeyPost } from './api';
 
 const resources = {
     en: {
@@ -104,6 +104,7 @@ const resources = {
                 'Manage Waitlist of {{level.name}}{{class.name}}',
             'waitlist.manage.in_process': 'In progress',
             'waitlist.manage.close': 'Close',
+            'waitlist.manage.save': 'Save',
             'waitlist.print.button': '<img src="/pdf.svg" height="20" alt="PDF icon" />',
             'waitlist.print.button.tooltip': 'Print an exam',
             'waitlist.print.title': 'Print an exam',
@@ -137,9 +138,9 @@ const resources = {
             'belt.add_edit.color.help': 'Color of the belt',
             'belt.add_edit.color.placeholder': 'Choose a color',
             'belt.move.up.title': 'Move up',
-            'belt.move.up.in_process': 'Moving up',
             'belt.move.down.title': 'Move down',
-            'belt.move.down.in_process': 'Moving down',
+            'belt.order.save': 'Save the order',
+            'belt.order.in_process': 'Saving',
             'belt.delete.button': '🗑️',
             'belt.delete.button.tooltip': 'Delete',
             'belt.delete.title': 'Delete Belt: {{belt.name}}',
@@ -511,6 +512,7 @@ const resources = {
                 "Gérer la liste d'attente de la {{level.name}}{{class.name}}",
             'waitlist.manage.in_process': 'En cours',
             'waitlist.manage.close': 'Fermer',
+            'waitlist.manage.save': 'Enregistrer',
             'waitlist.print.button': '<img src="/pdf.svg" height="20" alt="Icône de PDF" />',
             'waitlist.print.button.tooltip': 'Imprimer un examen',
             'waitlist.print.title': 'Imprimer un examen',
@@ -544,9 +546,9 @@ const resources = {
             'belt.add_edit.color.help': 'Couleur de la ceinture',
             'belt.add_edit.color.placeholder': 'Choisissez une couleur',
             'belt.move.up.title': 'Monter',
-            'belt.move.up.in_process': 'Montée',
             'belt.move.down.title': 'Descendre',
-            'belt.move.down.in_process': 'Descente',
+            'belt.order.save': 'Enregistrer l\'ordre',
+            'belt.order.in_process': 'Enregistrement',
             'belt.delete.button': '🗑️',
             'belt.delete.button.tooltip': 'Supprimer',
             'belt.delete.title': 'Supprimer la ceinture: {{belt.name}}',
@@ -827,17 +829,33 @@ const resources = {
     },
 };
 
+// sent together, once the page has settled
+const missingKeys: MissingI18nKeyPost[] = [];
+let missingKeysTimeout: ReturnType<typeof setTimeout> | undefined;
+
+function sendMissingKeys() {
+    missingKeysTimeout = undefined;
+    while (missingKeys.length > 0) {
+        DefaultService.postMissingI18NKeysResource({
+            events: missingKeys.splice(0, 100),
+        });
+    }
+}
+
 function missingKeyHandler(
     _languages: readonly string[],
     namespace: string,
     key: string
 ) {
     console.log(_languages, namespace, key);
-    DefaultService.postMissingI18NKeyResource({
+    missingKeys.push({
         language: i18n.language,
         namespace,
         key,
     });
+    if (missingKeysTimeout === undefined) {
+        missingKeysTimeout = setTimeout(sendMissingKeys, 1000);
+    }
 }
 
 i18n.use(initReactI18next)